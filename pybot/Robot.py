@@ -1,9 +1,15 @@
 from .module_camera.Camera import Camera
+from .module_camera.camera_settings import CameraSettings
+from .module_camera.frame_sources import open_frame_source
+from .module_camera.card_enrollment import prepare_enrollments, read_enrollments
+from .module_camera.marker_matcher import marker_image
 from .module_fenetre import module as fenetre
 from .module_fenetre.Input import Input
 from .module_webapp import create_app
+from .module_webapp.dao import user as user_dao
 from .module_ia.IA import ChatBot
 import pygame as pg
+import cv2
 import io, os, sys
 from pathlib import Path
 import time
@@ -11,6 +17,7 @@ import requests
 from dotenv import load_dotenv
 # Typing
 from typing import List, Dict
+from concurrent.futures import Future
 from .types import Couleur, User
 from cv2.typing import MatLike
 from .module_fenetre.Interface import Button
@@ -28,6 +35,8 @@ class Robot:
         self.events = []
         # camera
         self.camera = None
+        self.cameras: List[Camera] = []
+        """Caméras ouvertes, la caméra numéro 0 (self.camera) est celle de Robot.creer_fenetre()."""
         # Utilisateur connecté
         self.utilisateur_connecte = None
         self.chatBot = None
@@ -63,18 +72,94 @@ class Robot:
             self.webapp.run()
             sys.exit()
 
-    def creer_fenetre(self, longueur: int = 800, hauteur: int = 600):
+    def creer_fenetre(
+        self,
+        longueur: int = 800,
+        hauteur: int = 600,
+        resolution_camera: tuple = None,
+        ips_camera: float = None,
+        format_camera: str = None,
+        tampon_camera: int = None,
+        source_camera: int | str = 0,
+        temps_reel: bool = True,
+    ):
         '''
             Créé une fenêtre avec une longueur et une hauteur passées en argument (en nombre de pixels). \n
-            Si un argument n'est pas donné, la longueur par défaut sera 800 pixels et la hauteur par défaut sera 600 pixels.
+            Si un argument n'est pas donné, la longueur par défaut sera 800 pixels et la hauteur par défaut sera 600 pixels. \n
+            Les réglages de la caméra sont optionnels, ceux par défaut de la caméra sont utilisés sinon : \n
+                * resolution_camera : (longueur, hauteur) des images, par exemple (640, 480) \n
+                * ips_camera : nombre d'images par seconde, par exemple 30 \n
+                * format_camera : format des images, par exemple "MJPG", souvent plus rapide que celui par défaut \n
+                * tampon_camera : nombre d'images gardées par la caméra, 1 pour les images les plus récentes \n
+            La caméra peut utiliser des réglages proches si ceux demandés ne sont pas disponibles (voir Robot.infos_camera()). \n
+            Les images peuvent aussi venir d'un enregistrement, pour tester sans caméra ou rejouer les mêmes images : \n
+                * source_camera : numéro de la caméra (défaut: 0), ou chemin d'une vidéo ou d'un dossier d'images \n
+                * temps_reel : avec un enregistrement, le rejouer à sa vitesse (défaut: True) ou le plus vite possible sans sauter d'image (False)
         '''
         self.fenetre = fenetre.run(self, longueur, hauteur)
-        self.camera = Camera(self.fenetre.surface)
+        settings = CameraSettings(resolution_camera, ips_camera, format_camera, tampon_camera)
+        try:
+            source = open_frame_source(source_camera, settings, temps_reel)
+        except FileNotFoundError:
+            self.message_erreur(f"la source {source_camera} n'a pas pu être ouverte, la caméra 0 est utilisée.")
+            source = None
+        self.camera = Camera(self.fenetre.surface, settings, source)
+        self.cameras = [self.camera]
         try:
             self.camera.updateUserCardsTracker(self.webapp)
         except ValueError:
             self.message_erreur("L'application web doit être lancée avant de créer la fenêtre.")
 
+    def ajouter_camera(
+        self,
+        source_camera: int | str = 1,
+        resolution_camera: tuple = None,
+        ips_camera: float = None,
+        format_camera: str = None,
+        tampon_camera: int = None,
+        temps_reel: bool = True,
+    ) -> int:
+        '''
+            Ouvre une caméra de plus, par exemple une pour reconnaître les cartes et une autre pour les photos. \n
+            Retourne son numéro, à donner aux fonctions de la caméra (afficher_camera, connecter...) pour l'utiliser. \n
+            Les paramètres sont ceux de la caméra de Robot.creer_fenetre() : \n
+                * source_camera : numéro de la caméra (défaut: 1), ou chemin d'une vidéo ou d'un dossier d'images \n
+                * resolution_camera, ips_camera, format_camera, tampon_camera, temps_reel : voir Robot.creer_fenetre() \n
+            Chaque caméra lit ses images et reconnaît les cartes de son côté :
+            la reconnaissance sur une caméra ne ralentit pas l'affichage des autres.
+        '''
+        if self.camera is None:
+            self.message_erreur("la fenêtre n'a pas été ouverte.")
+            return None
+        settings = CameraSettings(resolution_camera, ips_camera, format_camera, tampon_camera)
+        try:
+            source = open_frame_source(source_camera, settings, temps_reel)
+        except FileNotFoundError:
+            self.message_erreur(f"la source {source_camera} n'a pas pu être ouverte.")
+            return None
+        if not source.isOpened():
+            source.release()
+            self.message_erreur(f"la caméra {source_camera} n'a pas pu être ouverte.")
+            return None
+        camera = Camera(self.fenetre.surface, settings, source)
+        # Les cartes des utilisateurs créés ou supprimés sont à jour pour toutes les caméras
+        camera.card_tracker = self.camera.card_tracker
+        self.cameras.append(camera)
+        return len(self.cameras) - 1
+
+    def _camera(self, camera: int) -> Camera:
+        '''
+            Ne pas utiliser
+            Retourne la caméra de ce numéro, None avec un message d'erreur si elle n'existe pas.
+        '''
+        if not self.cameras:
+            self.message_erreur("la fenêtre n'a pas été ouverte.")
+            return None
+        if not 0 <= camera < len(self.cameras):
+            self.message_erreur(f"la caméra {camera} n'existe pas (voir Robot.ajouter_camera()).")
+            return None
+        return self.cameras[camera]
+
     def changer_titre(self, titre: str):
         '''
             Changer le titre de la fenêtre.
@@ -121,7 +206,8 @@ class Robot:
             Combiné avec un évènement (par exemple appuyer sur une touche ou un bouton) cette méthode peut etre utilisée pour arrêter le programme.
         '''
         try:
-            self.camera.stop()
+            for camera in self.cameras:
+                camera.stop()
             self.fenetre.stop()
             self.actif = False
         except AttributeError:
@@ -221,17 +307,77 @@ class Robot:
 
     ### CAMERA - PHOTOS ###
 
-    def afficher_camera(self, position_x: int = 0, position_y: int = 0):
+    def afficher_camera(self, position_x: int = 0, position_y: int = 0, camera: int = 0):
         """
-            Affiche la caméra aux coordonées x et y.
+            Affiche la caméra aux coordonées x et y. \n
+            camera : numéro de la caméra (défaut: 0, voir Robot.ajouter_camera()).
         """
-        self.camera.display(position_x, position_y)
+        camera = self._camera(camera)
+        if camera is not None:
+            camera.display(position_x, position_y)
 
-    def prendre_photo(self, nom_fichier: str):
+    def infos_camera(self, camera: int = 0) -> dict:
         """
-            Capture une image de la caméra au nom du fichier passé en paramètre et l'enregistre dans le dossier images.
+            Renvoie les réglages de la caméra du numéro donné (défaut: 0) : \n
+                * "requested" : les réglages demandés à Robot.creer_fenetre() ou Robot.ajouter_camera() \n
+                * "actual" : les réglages vraiment utilisés par la caméra \n
+                * "measured_fps" : le nombre d'images par seconde mesuré \n
+                * "latency_ms" : l'âge moyen des images quand elles sont utilisées, en millisecondes \n
+                * "dropped_frames" : le nombre d'images ignorées car une plus récente était disponible
         """
-        self.camera.capture(nom_fichier)
+        camera = self._camera(camera)
+        if camera is not None:
+            return camera.capture_report()
+
+    def regler_seuil_mouvement(self, seuil: float = 4.0, camera: int = 0):
+        """
+            Règle la sensibilité de la détection de mouvement devant la caméra. \n
+            Tant que l'image bouge moins que le seuil (différence entre 0 et 255 des zones
+            de l'image qui changent le plus), la reconnaissance des cartes n'est pas refaite. \n
+            Un seuil de -1 refait la reconnaissance à chaque image. \n
+            camera : numéro de la caméra réglée (défaut: 0).
+        """
+        camera = self._camera(camera)
+        if camera is not None:
+            camera.motion_gate.threshold = seuil
+
+    def prendre_photo(self, nom_fichier: str, camera: int = 0) -> Future | None:
+        """
+            Capture une image de la caméra au nom du fichier passé en paramètre et l'enregistre dans le dossier images. \n
+            L'enregistrement se fait en arrière-plan, la fenêtre n'est pas bloquée pendant ce temps. \n
+            camera : numéro de la caméra (défaut: 0, voir Robot.ajouter_camera()). \n
+            Retourne un Future du chemin de la photo, terminé une fois la photo enregistrée (voir concurrent.futures),
+            None avec un message d'erreur si la photo n'a pas pu être prise.
+        """
+        camera = self._camera(camera)
+        if camera is None:
+            return None
+        photo = camera.capture(nom_fichier)
+        if photo is None:
+            self.message_erreur(f"la photo {nom_fichier} n'a pas pu être prise, la caméra n'a pas encore d'image ou trop de photos sont en attente.")
+            return None
+        photo.add_done_callback(self._verifier_photo)
+        return photo
+
+    def _verifier_photo(self, photo: Future):
+        """Affiche l'erreur de l'enregistrement d'une photo, appelée par le thread qui l'a enregistrée."""
+        if photo.exception() is not None:
+            self.message_erreur(f"la photo n'a pas pu être enregistrée: {photo.exception()}")
+
+    def prendre_photos_rafale(self, nom_fichier: str, nombre: int = 5, intervalle: float = 0.2, camera: int = 0):
+        r"""
+            Capture une rafale d'images de la caméra et les enregistre dans le dossier images,
+            sous les noms nom_fichier_1, nom_fichier_2... \n
+            Les paramètres attendus sont : \n
+                * Le nom des fichiers. \n
+                * Le nombre de photos (défaut: 5). \n
+                * Le temps entre 2 photos en secondes (défaut: 0.2). \n
+                * Le numéro de la caméra (défaut: 0). \n
+            Les photos sont prises en arrière-plan, la fenêtre n'est pas bloquée pendant la rafale.
+        """
+        camera = self._camera(camera)
+        if camera is not None:
+            camera.capture_burst(nom_fichier, nombre, intervalle)
 
     def afficher_image(self, chemin_fichier: str, position_x: int, position_y: int):
         r"""
@@ -255,7 +401,7 @@ class Robot:
 
     ### RECONNAISANCE CARTES - SESSION UTILISATEUR ###
 
-    def connecter(self, seuil_minimal: float = 0.75, seuil_arret_recherche: float = 0.85):
+    def connecter(self, seuil_minimal: float = 0.75, seuil_arret_recherche: float = 0.85, methode: str = "ssim", en_arriere_plan: bool = True, camera: int = 0):
         """
             Affiche à l'écran un cadre autour de la carte et
             connecte l'utilisateur si reconnu.
@@ -265,22 +411,41 @@ class Robot:
                     qu'une carte détectée soit considérée comme valide.
                 * seuil_arret_recherche (défaut: 0.85) : score pour
                     qu'une carte détectée soit interprétée comme la bonne.
+                * methode (défaut: "ssim") : méthode de reconnaissance des cartes,
+                    "ssim" (similarité des images), "orb" (points clés, insensible
+                    à l'orientation de la carte et adaptée à beaucoup d'utilisateurs)
+                    ou "aruco" (marqueur imprimé sur la carte, voir
+                    Robot.enregistrer_marqueur_carte(), "ssim" pour les cartes sans marqueur).
+                * en_arriere_plan (défaut: True) : la reconnaissance est faite dans
+                    un autre processus sans ralentir l'affichage. Le résultat
+                    correspond alors à une image précédente de la caméra.
+                * camera (défaut: 0) : numéro de la caméra où chercher la carte
+                    (voir Robot.ajouter_camera()).
         """
         if self.webapp is None:
             self.message_avertissement(
                 "La fonction Robot.connecter() a été appelée"
                 "sans Robot.demarrer_webapp()")
             return
-        elif not self.camera.camera.isOpened():
+        camera = self._camera(camera)
+        if camera is None or not camera.camera.isOpened():
+            return
+        try:
+            utilisateur_reconnu, _ = camera.detect_user(seuil_minimal,
+                                                             seuil_arret_recherche,
+                                                             methode,
+                                                             en_arriere_plan)
+        except ValueError as e:
+            self.message_erreur(str(e))
             return
-        utilisateur_reconnu, _ = self.camera.detect_user(seuil_minimal,
-                                                         seuil_arret_recherche)
         if utilisateur_reconnu and self.verifier_session():
             self.message_avertissement("Un utilisateur est déjà connecté.")
         elif utilisateur_reconnu:
             self.utilisateur_connecte = utilisateur_reconnu
+            # Sa carte sera comparée en premier aux prochaines connexions
+            camera.card_tracker.record_login(utilisateur_reconnu.id)
 
-    def detecter_carte(self, seuil_minimal: float = 0.75, seuil_arret_recherche: float = 0.85) -> MatLike:
+    def detecter_carte(self, seuil_minimal: float = 0.75, seuil_arret_recherche: float = 0.85, methode: str = "ssim", en_arriere_plan: bool = True, camera: int = 0) -> MatLike:
         """
             Methode permettant de récupérer la carte détectée à l' écran.
             Carte qui n est pas une carte déjà enregistrée.
@@ -290,18 +455,80 @@ class Robot:
                     qu'une carte détectée soit considérée comme valide.
                 * seuil_arret_recherche (défaut: 0.85) : score pour
                     qu'une carte détectée soit interprétée comme la bonne.
+                * methode (défaut: "ssim") : méthode de reconnaissance des cartes,
+                    "ssim", "orb" ou "aruco" (voir Robot.connecter()).
+                * en_arriere_plan (défaut: True) : reconnaissance dans un autre
+                    processus (voir Robot.connecter()).
+                * camera (défaut: 0) : numéro de la caméra où chercher la carte.
         """
         if self.webapp is None:
             self.message_avertissement(
                 "La fonction Robot.detecter_carte() a été appelée"
                 "sans Robot.demarrer_webapp()")
             return None
-        elif not self.camera.camera.isOpened():
+        camera = self._camera(camera)
+        if camera is None or not camera.camera.isOpened():
+            return None
+        try:
+            carte_reconnue, _ = camera.detect_card(seuil_minimal,
+                                                        seuil_arret_recherche,
+                                                        methode,
+                                                        en_arriere_plan)
+        except ValueError as e:
+            self.message_erreur(str(e))
             return None
-        carte_reconnue, _ = self.camera.detect_card(seuil_minimal,
-                                                    seuil_arret_recherche)
         return carte_reconnue
 
+    def detecter_utilisateurs(self, seuil_minimal: float = 0.75, seuil_arret_recherche: float = 0.85, methode: str = "ssim", en_arriere_plan: bool = True, camera: int = 0) -> List[AttributeDict]:
+        """
+            Methode permettant de reconnaître toutes les cartes d'utilisateurs
+            visibles à l'écran en une seule recherche, par exemple pour une
+            activité de groupe. Chaque carte reconnue est encadrée.
+
+            Paramètres:
+                * seuil_minimal (défaut: 0.75) : score minimum pour
+                    qu'une carte détectée soit considérée comme valide.
+                * seuil_arret_recherche (défaut: 0.85) : score pour
+                    qu'une carte détectée soit interprétée comme la bonne.
+                * methode (défaut: "ssim") : méthode de reconnaissance des cartes,
+                    "ssim", "orb" ou "aruco" (voir Robot.connecter()).
+                * en_arriere_plan (défaut: True) : reconnaissance dans un autre
+                    processus (voir Robot.connecter()).
+                * camera (défaut: 0) : numéro de la caméra où chercher les cartes.
+
+            Retourne:
+                * une liste avec, pour chaque carte reconnue :
+                    - id, prenom et nom de l'utilisateur
+                    - confiance : score de la reconnaissance, entre 0 et 1
+                    - contour : coins (x, y) de la carte dans la fenêtre
+        """
+        if self.webapp is None:
+            self.message_avertissement(
+                "La fonction Robot.detecter_utilisateurs() a été appelée"
+                "sans Robot.demarrer_webapp()")
+            return []
+        camera = self._camera(camera)
+        if camera is None or not camera.camera.isOpened():
+            return []
+        try:
+            utilisateurs_reconnus, _ = camera.detect_users(seuil_minimal,
+                                                           seuil_arret_recherche,
+                                                           methode,
+                                                           en_arriere_plan)
+        except ValueError as e:
+            self.message_erreur(str(e))
+            return []
+        return [
+            AttributeDict({
+                "id": reconnu.user.id,
+                "prenom": reconnu.user.first_name,
+                "nom": reconnu.user.last_name,
+                "confiance": reconnu.confidence,
+                "contour": camera.screen_points(reconnu.contour),
+            })
+            for reconnu in utilisateurs_reconnus
+        ]
+
     def afficher_carte_detectee(self, carte_detectee: MatLike, position_x: int, position_y: int):
         r"""
             Afficher la carte détectée. \n
@@ -374,12 +601,77 @@ class Robot:
                     self.message_erreur("[HTTP ERROR]" + str(response.content))
                 else:
                     print("Success")
-                    # Update les cartes des sessions chargées lors
-                    #   de la construction de CardsTracker
-                    self.camera.updateUserCardsTracker(self.webapp)
+                    # Ajoute la carte du nouvel utilisateur à celles
+                    #   reconnues par le CardsTracker
+                    self.camera.card_tracker.add_user(response.json()["id"])
             except Exception as e:
                 self.message_erreur("[HTTP EXCEPTION]" + str(e))
 
+    def creer_utilisateurs(self, source: str) -> int:
+        r"""
+            Crée d'un coup les utilisateurs de toute une classe, à partir : \n
+                * d'un dossier d'images de cartes nommées prenom_nom.png (ou .jpg) \n
+                * ou d'un fichier CSV avec les colonnes prenom, nom et carte
+                  (le chemin de l'image de la carte, depuis le dossier du fichier CSV) \n
+            Les images peuvent être des photos des cartes ou les dessins seuls, elles sont
+            préparées en parallèle. Les images sans carte sont ignorées avec un avertissement. \n
+            Retourne le nombre d'utilisateurs créés.
+        """
+        if self.webapp is None:
+            self.message_avertissement(
+                "La fonction Robot.creer_utilisateurs() a été appelée"
+                "sans Robot.demarrer_webapp()")
+            return 0
+        try:
+            inscriptions, erreurs = read_enrollments(source)
+        except OSError as e:
+            self.message_erreur(f"{source} n'a pas pu être lu : {e}")
+            return 0
+        nouveaux_utilisateurs = []
+        for inscription, (carte, erreur) in zip(inscriptions, prepare_enrollments(inscriptions)):
+            if carte is None:
+                erreurs.append(erreur)
+                continue
+            nouveaux_utilisateurs.append({
+                "first_name": inscription.first_name,
+                "last_name": inscription.last_name,
+                "picture": io.BytesIO(carte),
+            })
+        for erreur in erreurs:
+            self.message_avertissement(f"carte ignorée, {erreur}")
+        if not nouveaux_utilisateurs:
+            return 0
+        # Directement dans la base de données plutôt qu'une requête HTTP par utilisateur,
+        #   pour tous les créer dans une seule transaction
+        try:
+            with self.webapp.app_context():
+                user_dao.create_many(nouveaux_utilisateurs)
+        except Exception as e:
+            self.message_erreur("[DATABASE EXCEPTION]" + str(e))
+            return 0
+        if self.camera is not None and self.camera.card_tracker is not None:
+            # Une seule reconstruction des cartes reconnues pour tous les nouveaux utilisateurs
+            self.camera.card_tracker.reload_users()
+        return len(nouveaux_utilisateurs)
+
+    def enregistrer_marqueur_carte(self, nom_fichier: str):
+        """
+            Enregistre dans le dossier images le marqueur de l'utilisateur connecté,
+            à imprimer et coller sur sa carte. \n
+            Avec la méthode "aruco" (voir Robot.connecter()), une carte portant son marqueur
+            est reconnue aussi vite quel que soit le nombre d'utilisateurs.
+        """
+        if not self.verifier_session():
+            self.message_avertissement("Aucun utilisateur n'est connecté")
+            return
+        try:
+            marqueur = marker_image(self.camera.card_tracker.get_marker_id(self.utilisateur_connecte.id))
+        except ValueError as e:
+            self.message_erreur(str(e))
+            return
+        if not cv2.imwrite("images/" + nom_fichier + ".png", marqueur):
+            self.message_erreur(f"le marqueur n'a pas pu être enregistré dans images/{nom_fichier}.png")
+
     def supprimer_utilisateur(self):
         """
            Supprime l'utilisateur connecté.
@@ -394,9 +686,9 @@ class Robot:
                 self.message_erreur("[HTTP ERROR]" + str(response.content))
             else:
                 self.deconnecter()
-                # Update les cartes des sessions chargées lors
-                #   de la construction de CardsTracker
-                self.camera.updateUserCardsTracker(self.webapp)
+                # Retire la carte de l'utilisateur de celles
+                #   reconnues par le CardsTracker
+                self.camera.card_tracker.remove_user(id)
         except Exception as e:
             self.message_erreur("[HTTP EXCEPTION]" + str(e))
 
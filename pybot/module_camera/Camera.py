@@ -1,16 +1,69 @@
 import cv2
+import threading
+import time
 import numpy as np
 import pygame as pg
+from concurrent.futures import Future
 from .UserCardsTracker import UserCardsTracker
+from .frame_grabber import FrameGrabber
+from .card_detection import CardsDetection
+from .card_tracking import CardTracks
+from .match_cache import MatchCache
+from .detection_worker import CardDetectionWorker, DetectionKey
+from .motion_gate import MotionGate
+from .photo_writer import PhotoWriter
+from .camera_settings import CameraSettings
+from .frame_sources import DeviceSource, FrameSource
 from flask import Flask
+from cv2.typing import MatLike
+from typing import Dict, List
+
+CONTOUR_WIDTH = 3
+"""Width, in pixels, of the cards contours drawn over the camera frame."""
+
+BURST_FRAME_TIMEOUT = 1.0
+"""Seconds a photo of a burst waits for a camera frame not taken yet, before it is skipped."""
 
 
 class Camera:
-    def __init__(self, surface):
+    def __init__(self, surface, settings: CameraSettings | None = None, source: FrameSource | None = None):
+        """
+        Params
+            - surface: pygame surface the frames are displayed on
+            - settings: capture settings to ask the camera for, driver defaults if not given
+            - source: where the frames come from, e.g. a recording, camera device 0 with `settings` if not given
+        """
         self.frame = None
-        self.camera = cv2.VideoCapture(0)
+        """Persistent pygame surface of the last camera frame."""
+        self.frame_array = None
+        """Canonical last camera frame: RGB numpy array in pygame layout (width, height, 3)."""
+        self.frame_seq = 0
+        """Sequence number of the camera frame held by `self.frame_array`."""
+        self._rgb_buffer = None
+        self.requested_settings = settings or CameraSettings()
+        self.camera: FrameSource = source or DeviceSource(0, self.requested_settings)
+        self.settings = self.camera.settings
+        """Settings the camera actually uses."""
+        self.grabber = FrameGrabber(self.camera)
         self.surface = surface
+        self.photo_writer = PhotoWriter()
+        """Encode and write the photos outside of the render loop."""
         self.card_tracker: UserCardsTracker = None
+        self.detection_worker: CardDetectionWorker = None
+        """Process scanning the frames of asynchronous detections, started on first use."""
+        self.motion_gate = MotionGate()
+        """Skip the detections while the scene in front of the camera does not move."""
+        self._detections: Dict[DetectionKey, CardsDetection] = {}
+        """Last detection of each kind, reused while the scene is static."""
+        self._frame_detections: Dict[DetectionKey, CardsDetection] = {}
+        """Detections returned for the frame `self._frame_detections_seq`, shared by all the detection calls on that frame."""
+        self._frame_detections_seq = 0
+        self._pending_thumbnails: Dict[DetectionKey, MatLike] = {}
+        """Thumbnail of the frame submitted to the detection worker, for each kind."""
+        self._card_tracks: Dict[DetectionKey, CardTracks] = {}
+        """Cards followed over the frames scanned in this process, for each kind."""
+        self.match_caches: Dict[str, MatchCache] = {}
+        """Results of the cards matched in this process, for each method. Their counters give the hit rate."""
         self.x = 0
         self.y = 0
 
@@ -20,71 +73,254 @@ class Camera:
             raise ValueError
         self.card_tracker = UserCardsTracker(webapp)
 
+    @property
+    def dropped_frames(self) -> int:
+        """Number of camera frames skipped because a newer one was already available."""
+        return self.grabber.dropped_frames
+
+    def capture_report(self) -> dict:
+        """Requested and actual capture settings, with the measured frame rate and latency."""
+        latency = self.grabber.latency
+        return {
+            "requested": self.requested_settings._asdict(),
+            "actual": self.settings._asdict(),
+            "measured_fps": self.grabber.fps,
+            "latency_ms": None if latency is None else latency * 1000,
+            "dropped_frames": self.grabber.dropped_frames,
+        }
+
     def stop(self):
+        if self.detection_worker is not None:
+            self.detection_worker.stop()
+        self.grabber.stop()
+        self.photo_writer.stop()
         self.camera.release()
         cv2.destroyAllWindows()
 
+    def _update_frame(self, image: MatLike):
+        """
+        Convert the BGR camera `image` into `self.frame_array` and `self.frame`.
+        The buffers are allocated once and reused for each frame of the same size.
+        """
+        height, width = image.shape[:2]
+        if self.frame_array is None or self.frame_array.shape[:2] != (width, height):
+            self._rgb_buffer = np.empty((height, width, 3), np.uint8)
+            self.frame_array = np.empty((width, height, 3), np.uint8)
+            self.frame = pg.Surface((width, height))
+        cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=self._rgb_buffer)
+        # Same as np.rot90: pygame arrays are indexed [x][y], the image is mirrored
+        cv2.rotate(self._rgb_buffer, cv2.ROTATE_90_COUNTERCLOCKWISE, dst=self.frame_array)
+        pg.surfarray.blit_array(self.frame, self.frame_array)
+
     def display(self, x, y):
         self.x = x
         self.y = y
         try:
-            ret, self.frame = self.camera.read()
-            self.frame = cv2.cvtColor(self.frame, cv2.COLOR_BGR2RGB)
-            self.frame = np.rot90(self.frame)
-            self.frame = pg.surfarray.make_surface(self.frame)
+            latest = self.grabber.latest()
+            if latest is None:
+                return
+            # Convert only the frames not displayed yet
+            if latest.seq != self.frame_seq:
+                self._update_frame(latest.image)
+                self.frame_seq = latest.seq
             self.surface.blit(self.frame, (self.x, self.y))
         except:
             pass
 
-    def capture(self, file_name):
-        try:
-            ret, frame = self.camera.read()
-            if not ret:
-                return None
-            frame = cv2.flip(frame, 1)
-            cv2.imwrite("images/" + file_name + ".jpg", frame)
-        except:
-            pass
+    def capture(self, file_name) -> Future | None:
+        """
+        Save the current camera frame as images/`file_name`.jpg, without waiting for it to be written.
 
-    def detect_card(self, min_threshold: float, stop_threshold: float):
+        Returns
+            - a Future of the photo path, None if there is no frame yet or too many photos are waiting.
+        """
+        # Only the render loop consumes the frames, see `FrameGrabber.latest`
+        latest = self.grabber.peek()
+        if latest is None:
+            return None
+        return self._save_photo(latest.image, file_name)
+
+    def _save_photo(self, image: MatLike, file_name) -> Future | None:
+        return self.photo_writer.save(image, "images/" + file_name + ".jpg")
+
+    def capture_burst(self, file_name, count: int, interval: float) -> Future:
+        """
+        Save `count` camera frames taken every `interval` seconds as images/`file_name`_1.jpg, _2.jpg...
+        The frames are taken in a background thread, the call does not wait. Each photo is a different
+        frame: with an `interval` shorter than the camera one, a photo waits for the next frame.
+
+        Returns
+            - a Future of the list of the photos paths, without the photos that could not be taken.
+        """
+        burst = Future()
+
+        def take_photos():
+            futures: List[Future] = []
+            seq = 0
+            for i in range(1, count + 1):
+                if i > 1:
+                    time.sleep(interval)
+                frame = self.grabber.wait_newer(seq, BURST_FRAME_TIMEOUT)
+                if frame is None:
+                    continue
+                seq = frame.seq
+                futures.append(self._save_photo(frame.image, f"{file_name}_{i}"))
+            paths = []
+            for future in futures:
+                if future is not None and future.exception() is None:
+                    paths.append(future.result())
+            burst.set_result(paths)
+
+        threading.Thread(target=take_photos, daemon=True).start()
+        return burst
+
+    def _detect(self, min_threshold, stop_threshold, method: str, asynchronous: bool) -> CardsDetection | None:
+        """
+        Return the detection of the current frame, only made by the first call
+        on each frame, e.g. by `detect_user` then reused by `detect_card`.
+        """
+        if self._frame_detections_seq != self.frame_seq:
+            self._frame_detections = {}
+            self._frame_detections_seq = self.frame_seq
+        key = (min_threshold, stop_threshold, method)
+        detection = self._frame_detections.get(key)
+        if detection is not None and detection.generation == self.card_tracker.generation:
+            return detection
+        detection = self._detect_frame(min_threshold, stop_threshold, method, asynchronous)
+        if detection is not None:
+            self._frame_detections[key] = detection
+        return detection
+
+    def _detect_frame(self, min_threshold, stop_threshold, method: str, asynchronous: bool) -> CardsDetection | None:
+        """
+        Scan the current frame, or with `asynchronous` submit it to the detection
+        worker and return its latest detection. None if the worker has none yet.
+        While the scene does not move, the last detection is returned without scanning.
+        """
+        key = (min_threshold, stop_threshold, method)
+        thumbnail = self.motion_gate.thumbnail(self.frame_array)
+        if asynchronous:
+            if self.detection_worker is None:
+                self.detection_worker = CardDetectionWorker()
+            latest = self.detection_worker.poll(*key)
+            if latest is not None and latest is not self._detections.get(key):
+                self._detections[key] = latest
+                self.motion_gate.set_reference(self._pending_thumbnails.pop(key, None), key)
+        detection = self._detections.get(key)
+        if detection is None or detection.generation != self.card_tracker.generation:
+            self.motion_gate.reset(key)
+        if not self.motion_gate.should_scan(thumbnail, key):
+            return detection
+        if not asynchronous:
+            tracks = self._card_tracks.setdefault(key, CardTracks())
+            cache = self.match_caches.setdefault(method, MatchCache())
+            detection = self.card_tracker.detect_cards(self.frame_array, *key, tracks=tracks, cache=cache)
+            self._detections[key] = detection
+            self.motion_gate.set_reference(thumbnail, key)
+        elif self.detection_worker.submit(
+            self.frame_array,
+            *key,
+            self.card_tracker.references,
+        ):
+            self._pending_thumbnails[key] = thumbnail
+        return detection
+
+    def screen_points(self, contour: MatLike) -> List[List[int]]:
+        """Points (x, y) on the window of a `contour` found in `self.frame_array`, displayed at (self.x, self.y)."""
+        # The frame array is indexed [x][y]: the contours points are (y, x) on screen
+        return (contour.reshape(-1, 2)[:, ::-1] + (self.x, self.y)).tolist()
+
+    def _draw_contours(self, contours: List[MatLike], color):
+        """Draw the cards `contours`, found in `self.frame_array`, over the frame displayed at (self.x, self.y)."""
+        for contour in contours:
+            pg.draw.polygon(self.surface, color, self.screen_points(contour), CONTOUR_WIDTH)
+
+    def detect_card(self, min_threshold: float, stop_threshold: float, method: str = "ssim", asynchronous: bool = False):
         """
         Detect user and if user found, the card is detected and framed in the frame
 
         Params
             - min_threshold: Sufficient threshold to interpret frame as similar card
             - stop_threshold: Threshold to interpret frame as corresponding card
+            - method: card matching backend, see `card_references.MATCHERS`
+            - asynchronous: scan in the detection worker process without waiting,
+                the result is the one of a previous frame
         Returns
             - detected_card: card detected by algorithm and does not match any
                 user's card
+            - contours: contour of each card found, in `self.frame_array` coordinates
         """
         # Handle first launch of camera with 0 frame
-        if self.frame is None:
-            return []
-        frame, detected_card = self.card_tracker.get_detected_card(
-                self.frame,
+        if self.frame_array is None:
+            return None, None
+        detection = self._detect(min_threshold, stop_threshold, method, asynchronous)
+        if detection is None:
+            return None, None
+        contours, detected_card = self.card_tracker.get_detected_card(
+                self.frame_array,
                 min_threshold,
-                stop_threshold)
+                stop_threshold,
+                method,
+                detection=detection)
         if detected_card is not None:
-            self.surface.blit(frame, (self.x, self.y))
-        return detected_card, frame
+            self._draw_contours(contours, (0, 255, 255))
+        return detected_card, contours
 
-    def detect_user(self, min_threshold, stop_threshold):
+    def detect_user(self, min_threshold, stop_threshold, method: str = "ssim", asynchronous: bool = False):
         """
         Detect user and if user found, the card is detected and framed in the frame
 
         Params
             - min_threshold: Sufficient threshold to interpret frame as similar card
             - stop_threshold: Threshold to interpret frame as corresponding card
+            - method: card matching backend, see `card_references.MATCHERS`
+            - asynchronous: scan in the detection worker process without waiting,
+                the result is the one of a previous frame
         Returns
             - matching_user: User that matches the most for detected card
+            - contours: contour of each card found, in `self.frame_array` coordinates
         """
         # Handle first launch of camera with 0 frame
-        if self.frame is None:
-            return []
-        frame, user_detected = self.card_tracker.get_detected_user(
-                self.frame,
+        if self.frame_array is None:
+            return None, None
+        detection = self._detect(min_threshold, stop_threshold, method, asynchronous)
+        if detection is None:
+            return None, None
+        contours, user_detected = self.card_tracker.get_detected_user(
+                self.frame_array,
                 min_threshold,
-                stop_threshold)
+                stop_threshold,
+                method,
+                detection=detection)
         if user_detected is not None:
-            self.surface.blit(frame, (self.x, self.y))
-        return user_detected, frame
+            self._draw_contours(contours, (0, 255, 0))
+        return user_detected, contours
+
+    def detect_users(self, min_threshold, stop_threshold, method: str = "ssim", asynchronous: bool = False):
+        """
+        Identify every user card in the frame with a single scan, and frame each of them
+
+        Params
+            - min_threshold: Sufficient threshold to interpret frame as similar card
+            - stop_threshold: Threshold to interpret frame as corresponding card
+            - method: card matching backend, see `card_references.MATCHERS`
+            - asynchronous: scan in the detection worker process without waiting,
+                the result is the one of a previous frame
+        Returns
+            - detected_users: `DetectedUser` of each card identified
+            - contours: contour of each card found, in `self.frame_array` coordinates
+        """
+        # Handle first launch of camera with 0 frame
+        if self.frame_array is None:
+            return [], None
+        detection = self._detect(min_threshold, stop_threshold, method, asynchronous)
+        if detection is None:
+            return [], None
+        contours, detected_users = self.card_tracker.get_detected_users(
+                self.frame_array,
+                min_threshold,
+                stop_threshold,
+                method,
+                detection=detection)
+        self._draw_contours([detected.contour for detected in detected_users], (0, 255, 0))
+        return detected_users, contours
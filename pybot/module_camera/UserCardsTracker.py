@@ -1,28 +1,69 @@
-from cardscan import (
-    scan,
-    card_contours_transform,
-    rotate_top_left_corner_low_density_transform,
-)
 from ..module_webapp.dao import user
 from ..module_webapp.app import db
 import cv2
 import os
 from cv2.typing import MatLike
-from typing import List, Tuple
+from typing import List, NamedTuple, Tuple
 
 from sqlalchemy_media import StoreManager
-from .compare_images import ImageComparator
+from .card_references import CardReferences
+from .card_detection import CardsDetection, detect_cards
+from .card_tracking import CardTracks
+from .match_cache import MatchCache
+from .login_statistics import LoginStatistics
+from .marker_matcher import MARKER_COUNT
 from flask import Flask
 
 from ..module_webapp.models.user import UserResponse
 
 import pygame as pg
 
+REFERENCE_CACHE_DIR = ".cards_cache"
+"""Directory of the `ReferenceCache` and the `LoginStatistics`, next to the webapp static directory."""
+
+
+class DetectedUser(NamedTuple):
+    """A user whose card was identified in a frame."""
+
+    user: UserResponse
+    confidence: float
+    """Score of the card match, between 0 and 1, see `CardsDetection.match_scores`."""
+    contour: MatLike
+    """Contour of the card, in the frame coordinates."""
+
 
 class UserCardsTracker:
     def __init__(self, app: Flask):
-        self.users, user_image_paths = self._get_users_info(app)
-        self.image_comparator = ImageComparator(user_image_paths)
+        self.app = app
+        self.users, image_paths = self._get_users_info(app)
+        self.cache_dir = os.path.join(os.path.dirname(app.static_folder), REFERENCE_CACHE_DIR)
+        self.login_statistics = LoginStatistics(os.path.join(self.cache_dir, "logins.json"))
+        """Past logins of the users, the most frequent and recent ones are compared first."""
+        self.references = self._build_references(image_paths)
+        """The users cards, in `self.users` order, and the matchers built from them."""
+
+    def _build_references(self, image_paths: List[str]) -> CardReferences:
+        user_ids = [u.id for u in self.users]
+        return CardReferences(
+            user_ids,
+            image_paths,
+            [u.marker_id for u in self.users],
+            self.login_statistics.scores(user_ids),
+            self.cache_dir,
+        )
+
+    @property
+    def generation(self) -> int:
+        """Changes each time the tracked users change, see `CardReferences.generation`."""
+        return self.references.generation
+
+    @property
+    def user_image_paths(self) -> List[str]:
+        return self.references.image_paths
+
+    def get_matcher(self, method: str):
+        """Return the `method` matching backend. Raise ValueError if it does not exist."""
+        return self.references.get_matcher(method)
 
     @staticmethod
     def _get_users_info(app: Flask):
@@ -35,48 +76,105 @@ class UserCardsTracker:
                 ]
         return users, img_paths
 
+    def _get_user_info(self, user_id: int) -> Tuple[UserResponse, str]:
+        """Fetch the db user `user_id` and return it with its picture path."""
+        with self.app.app_context():
+            u = user.get(user_id)
+            with StoreManager(db.session):
+                img_path = os.path.join(self.app.static_folder, u.picture.path)
+        return u, img_path
+
+    def _get_user_idx(self, user_id: int) -> int:
+        for idx, u in enumerate(self.users):
+            if u.id == user_id:
+                return idx
+        raise ValueError(f"User {user_id} is not tracked")
+
+    def add_user(self, user_id: int):
+        """Start tracking the card of the db user `user_id`, without reloading the other users."""
+        u, img_path = self._get_user_info(user_id)
+        self.users.append(u)
+        self.references.add(u.id, img_path, u.marker_id, self.login_statistics.score(u.id))
+
+    def reload_users(self):
+        """
+        Fetch all the db users again and build the matchers once for all of them,
+        faster than `add_user` for each of many new users.
+        """
+        self.users, image_paths = self._get_users_info(self.app)
+        self.references = self._build_references(image_paths)
+
+    def record_login(self, user_id: int):
+        """Count a login of the user `user_id`, so its card is compared earlier to the next detected cards."""
+        self.login_statistics.record(user_id)
+        self.references.set_priorities(self.login_statistics.scores([u.id for u in self.users]))
+
+    def get_marker_id(self, user_id: int) -> int:
+        """
+        Return the id of the marker to print on the card of the db user `user_id`, given on first call
+        and kept in the database. Raise ValueError if all the markers are given to other users.
+        """
+        with self.app.app_context():
+            marker_id = user.allocate_marker(user_id, MARKER_COUNT)
+        for idx, u in enumerate(self.users):
+            if u.id == user_id and u.marker_id != marker_id:
+                self.users[idx], _ = self._get_user_info(user_id)
+                self.references.set_marker_id(idx, marker_id)
+        return marker_id
+
+    def remove_user(self, user_id: int):
+        """Stop tracking the card of the user `user_id`. Raise ValueError if it is not tracked."""
+        idx = self._get_user_idx(user_id)
+        del self.users[idx]
+        self.references.remove(idx)
+        self.login_statistics.remove(user_id)
+
+    def update_user(self, user_id: int):
+        """Reload the db user `user_id` and its card. Raise ValueError if it is not tracked."""
+        idx = self._get_user_idx(user_id)
+        u, img_path = self._get_user_info(user_id)
+        self.users[idx] = u
+        self.references.update(idx, u.id, img_path, u.marker_id)
+
     @staticmethod
     def _get_user_fullname(u: UserResponse) -> str:
         return f"{u.first_name} {u.last_name}"
 
-    def get_detected_card(self, frame: MatLike, min_threshold, stop_threshold) -> Tuple[MatLike, MatLike]:
+    def detect_cards(self, frame: MatLike, min_threshold, stop_threshold, method: str = "ssim", tracks: CardTracks | None = None, cache: MatchCache | None = None) -> CardsDetection:
+        """
+        Find the cards in `frame` and match them against the users cards with the `method` backend.
+        With `tracks`, the cards already identified on the previous frames are not matched again,
+        with `cache`, the cards already matched with `method` reuse their result.
+        """
+        return detect_cards(frame, self.get_matcher(method), min_threshold, stop_threshold, self.generation, tracks, cache)
+
+    def get_detected_card(self, frame: MatLike, min_threshold, stop_threshold, method: str = "ssim", detection: CardsDetection | None = None) -> Tuple[List[MatLike], MatLike]:
         """
             Find cards in the given `frame`.
-            Highlighted the cards contours.
 
             Params
-                - frame: 2D Frame
+                - frame: 2D RGB Frame in pygame layout (width, height, 3), not modified
                 - min_threshold: Sufficient threshold to interpret frame as similar card
                 - stop_threshold: Threshold to interpret frame as corresponding card
+                - method: card matching backend, a key of `card_references.MATCHERS`
+                - detection: `detect_cards` result to use instead of scanning `frame`
             Returns
                 Tuple:
-                    - frame: with card framed detected card
+                    - contours: contour of each card found, in `frame` coordinates
                     - card detected as image
         """
-        # Convert pygame.surface -> np_array
-        frame = pg.surfarray.array3d(frame)
-        # Returns array of images in frame that seems to be a card
-        contours, candidate_images = scan(
-            frame.copy(),
-            keep_results=[
-                card_contours_transform,
-                rotate_top_left_corner_low_density_transform,
-            ],
-        )
-        frame = cv2.drawContours(frame, contours, -1, (0, 255, 255), 3)
+        if detection is None:
+            detection = self.detect_cards(frame, min_threshold, stop_threshold, method)
+        # A detection made before the users changed may have missed a card just enrolled
+        if detection.generation != self.generation:
+            return detection.contours, None
         card_detected = None
-        for candidate_idx, candidate_img in enumerate(candidate_images):
-            user_idx = self.image_comparator.get_match_idx(
-                    candidate_img,
-                    min_threshold,
-                    stop_threshold)
+        for candidate_img, user_idx in zip(detection.candidate_images, detection.match_indices):
             if user_idx is not None:
                 continue
             # Store only card that does not match any user card
             card_detected = candidate_img
 
-        # convert np_array -> pyagame_surface
-        frame = pg.surfarray.make_surface(frame)
         if card_detected is not None:
             # Perform image manip to get same image as real one
             card_detected = cv2.flip(card_detected, 0)
@@ -84,62 +182,72 @@ class UserCardsTracker:
             card_detected = cv2.warpAffine(card_detected, M, (200, 200))
             # convert np_array -> pyagame_surface
             card_detected = pg.surfarray.make_surface(card_detected)
-        return frame, card_detected
+        return detection.contours, card_detected
 
-    def get_detected_user(self, frame: MatLike, min_threshold, stop_threshold) -> Tuple[MatLike, List[UserResponse]]:
+    def get_detected_users(self, frame: MatLike, min_threshold, stop_threshold, method: str = "ssim", detection: CardsDetection | None = None) -> Tuple[List[MatLike], List[DetectedUser]]:
+        """
+        Find every user whose card is in the given `frame`, with a single scan.
+
+        Params
+            - frame: 2D RGB Frame in pygame layout (width, height, 3), not modified
+            - min_threshold: Sufficient threshold to interpret frame as similar card
+            - stop_threshold: Threshold to interpret frame as corresponding card
+            - method: card matching backend, a key of `card_references.MATCHERS`
+            - detection: `detect_cards` result to use instead of scanning `frame`
+        Returns
+            Tuple:
+                - contours: contour of each card found, in `frame` coordinates
+                - each card identified, in `contours` order
+        """
+        if detection is None:
+            detection = self.detect_cards(frame, min_threshold, stop_threshold, method)
+        # Indices of a detection made before the users changed are not valid anymore
+        if detection.generation != self.generation:
+            return detection.contours, []
+        detected_users = [
+            DetectedUser(self.users[user_idx], score, contour)
+            for contour, user_idx, score in zip(detection.contours, detection.match_indices, detection.match_scores)
+            if user_idx is not None
+        ]
+        return detection.contours, detected_users
+
+    def get_detected_user(self, frame: MatLike, min_threshold, stop_threshold, method: str = "ssim", detection: CardsDetection | None = None) -> Tuple[List[MatLike], UserResponse]:
         """
         Find the matching user cards in the given `frame`.
-        Highlighted the card contours.
 
         Params
-            - frame: 2D Frame
+            - frame: 2D RGB Frame in pygame layout (width, height, 3), not modified
             - min_threshold: Sufficient threshold to interpret frame as similar card
             - stop_threshold: Threshold to interpret frame as corresponding card
+            - method: card matching backend, a key of `card_references.MATCHERS`
+            - detection: `detect_cards` result to use instead of scanning `frame`
         Returns
             Tuple:
-                - frame: with card framed detected card
-                - user found that matches the most
+                - contours: contour of each card found, in `frame` coordinates
+                - user of the last card identified, see `get_detected_users` for all of them
         """
-        # Convert pygame.surface -> np_array
-        frame = pg.surfarray.array3d(frame)
-        # Returns array of images in frame that seems to be a card
-        contours, candidate_images = scan(
-            frame.copy(),
-            keep_results=[
-                card_contours_transform,
-                rotate_top_left_corner_low_density_transform,
-            ],
-        )
-        frame = cv2.drawContours(frame, contours, -1, (0, 255, 0), 3)
-        user_match = None
-        for candidate_idx, candidate_img in enumerate(candidate_images):
-            user_idx = self.image_comparator.get_match_idx(candidate_img, min_threshold, stop_threshold)
-            if user_idx is None:
-                continue
-            u = self.users[user_idx]
-            user_match = u
-            #       --  Text handling  --
-            #   Issue: Text written vertically
-
-            # contour = contours[candidate_idx]
-            # text = self._get_user_fullname(u)
-            # font = cv2.FONT_HERSHEY_SIMPLEX
-            # bottom_left = max(contour, key=lambda edge: edge[0][0])[0]
-            # text_size = cv2.getTextSize(text, font, 0.7, 2)[0]
-            # textY = bottom_left[1] - 10
-            # textX = bottom_left[0] - text_size[0] // 2
-            # text_pos = (textX, textY)
-            # cv2.putText(
-            #   img=frame,
-            #   text=text,
-            #   org=text_pos,
-            #   fontFace=font,
-            #   fontScale=0.7,
-            #   color=(200, 0, 255, 127),
-            #   thickness=2,
-            #   lineType=cv2.LINE_AA,
-            #   bottomLeftOrigin=True)
-
-        # convert np_array -> pyagame_surface
-        frame = pg.surfarray.make_surface(frame)
-        return frame, user_match
+        contours, detected_users = self.get_detected_users(frame, min_threshold, stop_threshold, method, detection)
+        user_match = detected_users[-1].user if detected_users else None
+        #       --  Text handling  --
+        #   Issue: Text written vertically
+
+        # contour = detected_users[-1].contour
+        # text = self._get_user_fullname(user_match)
+        # font = cv2.FONT_HERSHEY_SIMPLEX
+        # bottom_left = max(contour, key=lambda edge: edge[0][0])[0]
+        # text_size = cv2.getTextSize(text, font, 0.7, 2)[0]
+        # textY = bottom_left[1] - 10
+        # textX = bottom_left[0] - text_size[0] // 2
+        # text_pos = (textX, textY)
+        # cv2.putText(
+        #   img=frame,
+        #   text=text,
+        #   org=text_pos,
+        #   fontFace=font,
+        #   fontScale=0.7,
+        #   color=(200, 0, 255, 127),
+        #   thickness=2,
+        #   lineType=cv2.LINE_AA,
+        #   bottomLeftOrigin=True)
+
+        return contours, user_match
@@ -0,0 +1,33 @@
+import os
+import tempfile
+from contextlib import contextmanager
+from typing import IO, Iterator
+
+
+@contextmanager
+def atomic_write(path: str, mode: str = "w") -> Iterator[IO]:
+    """
+    Open a temporary file next to `path`, which replaces `path` once the block exits
+    without error, so a concurrent reader never sees a partially written file.
+    The temporary file is removed if the block fails.
+
+    Params
+        - path: file to write, its directory is created if missing
+        - mode: "w" for text or "wb" for bytes
+    Raise OSError if the file can not be written.
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    _, suffix = os.path.splitext(path)
+    with tempfile.NamedTemporaryFile(mode, dir=directory, suffix=suffix, delete=False) as f:
+        try:
+            yield f
+        except BaseException:
+            f.close()
+            os.remove(f.name)
+            raise
+    try:
+        os.replace(f.name, path)
+    except OSError:
+        os.remove(f.name)
+        raise
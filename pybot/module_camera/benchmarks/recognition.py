@@ -0,0 +1,184 @@
+"""
+Measure how the card recognition scales with the number of enrolled users.
+
+Synthetic cards are enrolled the way users are, from a clean frame of the card, then
+recognized in synthetic camera frames. For each matcher and number of references, the
+scan time, match time, frames per second, top-1 accuracy and the time to add then remove
+a user are reported as JSON.
+
+Usage, from the project root:
+    python -m pybot.module_camera.benchmarks.recognition --sizes 10 100 1000 --output results.json
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import cv2
+import numpy as np
+from typing import Callable, Dict, List
+
+from ..compare_images import ImageComparator
+from ..orb_matcher import OrbCardMatcher
+from ..card_detection import scan_cards
+from ..cli import log
+from ..card_enrollment import enrollment_picture
+from ..card_references import HASH_PREFILTER_TOP_K, SSIM_PYRAMID_SIZES, THUMBNAIL_FALLBACK_TOP_K
+from .synthetic_cards import enrollment_frame, synthetic_card, synthetic_frame
+
+BENCHMARK_MATCHERS: Dict[str, Callable[[List[str]], object]] = {
+    "ssim": lambda paths: ImageComparator(
+        paths, prefilter_k=HASH_PREFILTER_TOP_K, fallback_k=THUMBNAIL_FALLBACK_TOP_K, pyramid_sizes=SSIM_PYRAMID_SIZES
+    ),
+    "ssim_exhaustive": lambda paths: ImageComparator(paths),
+    "orb": lambda paths: OrbCardMatcher(paths),
+}
+"""Matchers built from the enrolled cards pictures, "ssim" and "orb" as configured in `card_references.MATCHERS`."""
+
+
+def benchmark_card(seed: int, idx: int) -> np.ndarray:
+    """The card `idx` of the benchmark, generated again on demand rather than kept in memory."""
+    return synthetic_card(np.random.default_rng([seed, idx]))
+
+
+def enroll_cards(count: int, seed: int, directory: str) -> List[str]:
+    """Save the picture of the `count` first cards as `Robot.creer_utilisateurs` would, return their paths."""
+    paths = []
+    for i in range(count):
+        card = benchmark_card(seed, i)
+        picture = enrollment_picture(enrollment_frame(card))
+        if picture is None:
+            # A card whose contour is missed is still enrolled from its drawing
+            picture = enrollment_picture(card)
+        path = os.path.join(directory, f"card{i}.png")
+        cv2.imwrite(path, picture)
+        paths.append(path)
+    return paths
+
+
+def benchmark_matcher(matcher, frames: List[np.ndarray], expected: List[int | None], min_threshold: float, stop_threshold: float) -> dict:
+    """
+    Recognize the card of each frame.
+
+    Params
+        - frames: BGR camera frames of one card each
+        - expected: index of the reference of each frame card, None if it is not enrolled
+    """
+    scan_time = match_time = unknown_match_time = 0.0
+    detected = correct = enrolled = false_matches = unknown = 0
+    for frame, expected_idx in zip(frames, expected):
+        start = time.perf_counter()
+        _, candidate_images = scan_cards(frame)
+        scan_time += time.perf_counter() - start
+        start = time.perf_counter()
+        match_indices = [
+            idx for idx, _ in matcher.get_matches(candidate_images, min_threshold, stop_threshold)
+        ]
+        elapsed = time.perf_counter() - start
+        match_time += elapsed
+        if expected_idx is None:
+            unknown_match_time += elapsed
+        detected += bool(candidate_images)
+        predicted = match_indices[0] if match_indices else None
+        if expected_idx is None:
+            unknown += 1
+            false_matches += predicted is not None
+        else:
+            enrolled += 1
+            correct += predicted == expected_idx
+    return {
+        "frames": len(frames),
+        "scan_time_ms": 1000 * scan_time / len(frames),
+        "match_time_ms": 1000 * match_time / len(frames),
+        # Not enrolled cards are compared to more references before being rejected
+        "unknown_match_time_ms": 1000 * unknown_match_time / unknown if unknown else None,
+        "fps": len(frames) / (scan_time + match_time),
+        "detection_rate": detected / len(frames),
+        "top1_accuracy": correct / enrolled if enrolled else None,
+        "false_match_rate": false_matches / unknown if unknown else None,
+    }
+
+
+def run_benchmark(
+    sizes: List[int],
+    methods: List[str],
+    queries: int = 50,
+    unknown: int = 10,
+    min_threshold: float = 0.75,
+    stop_threshold: float = 0.85,
+    seed: int = 0,
+) -> dict:
+    """
+    Params
+        - sizes: numbers of enrolled references to benchmark
+        - methods: keys of `BENCHMARK_MATCHERS`
+        - queries: number of frames of enrolled cards per size
+        - unknown: number of frames of cards not enrolled per size
+        - min_threshold, stop_threshold: see `UserCardsTracker.detect_cards`
+    """
+    rng = np.random.default_rng(seed)
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        # One more card to measure the update of the references
+        paths = enroll_cards(max(sizes) + 1, seed, directory)
+        log(f"Enrolled {max(sizes)} cards in {time.perf_counter() - start:.1f}s")
+        for size in sorted(sizes):
+            expected = [int(i) for i in rng.integers(0, size, queries)] + [None] * unknown
+            frames = [synthetic_frame(benchmark_card(seed, i), rng) for i in expected[:queries]]
+            # Cards after the enrolled ones are unknown
+            frames += [synthetic_frame(benchmark_card(seed, max(sizes) + i), rng) for i in range(unknown)]
+            for method in methods:
+                start = time.perf_counter()
+                matcher = BENCHMARK_MATCHERS[method](paths[:size])
+                build_time = time.perf_counter() - start
+                result = {"method": method, "references": size, "build_time_s": build_time}
+                result.update(benchmark_matcher(matcher, frames, expected, min_threshold, stop_threshold))
+                start = time.perf_counter()
+                matcher.add_reference(paths[max(sizes)])
+                matcher.remove_reference(size)
+                result["update_time_ms"] = 1000 * (time.perf_counter() - start)
+                log(f"{method} x{size}: {result['fps']:.1f} fps, top-1 {result['top1_accuracy']}")
+                results.append(result)
+    return {
+        "config": {
+            "sizes": sorted(sizes),
+            "methods": methods,
+            "queries": queries,
+            "unknown": unknown,
+            "min_threshold": min_threshold,
+            "stop_threshold": stop_threshold,
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+
+def main(argv: List[str] | None = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--methods", nargs="+", choices=list(BENCHMARK_MATCHERS), default=["ssim", "orb"])
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--unknown", type=int, default=10)
+    parser.add_argument("--min-threshold", type=float, default=0.75)
+    parser.add_argument("--stop-threshold", type=float, default=0.85)
+    parser.add_argument("--seed", type=int, default=0)
+    # Not the standard output, pygame prints its banner there on import
+    parser.add_argument("--output", default="recognition_benchmark.json", help="JSON file to write")
+    args = parser.parse_args(argv)
+    report = run_benchmark(
+        args.sizes,
+        args.methods,
+        args.queries,
+        args.unknown,
+        args.min_threshold,
+        args.stop_threshold,
+        args.seed,
+    )
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    log(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import cv2
+import numpy as np
+from cv2.typing import MatLike
+from typing import Tuple
+
+CARD_SIZE = 400
+"""Side of the generated card drawings, in pixels."""
+
+BORDER_RATIO = 0.06
+"""Width of the dark border around the cards, relative to the card side."""
+
+
+def _ink(rng: np.random.Generator) -> Tuple[int, int, int]:
+    return tuple(int(c) for c in rng.integers(15, 80, 3))
+
+
+def synthetic_card(rng: np.random.Generator, size: int = CARD_SIZE) -> MatLike:
+    """
+    Random BGR drawing in the format of the users cards: dark strokes on a light
+    card, with a dark square in the top-left corner giving the card orientation.
+    """
+    card = np.full((size, size, 3), int(rng.integers(200, 245)), np.uint8)
+    mark = size // 14
+    cv2.rectangle(card, (mark // 2, mark // 2), (mark // 2 + mark, mark // 2 + mark), _ink(rng), -1)
+    # Strokes stay away from the corners so the mark is the darkest one
+    margin = size // 6
+    for _ in range(int(rng.integers(4, 9))):
+        thickness = int(rng.integers(3, 10))
+        shape = rng.integers(3)
+        if shape == 0:
+            points = rng.integers(margin, size - margin, (int(rng.integers(2, 6)), 2))
+            cv2.polylines(card, [points.astype(np.int32)], bool(rng.integers(2)), _ink(rng), thickness, cv2.LINE_AA)
+        elif shape == 1:
+            center = tuple(int(c) for c in rng.integers(2 * margin, size - 2 * margin, 2))
+            axes = tuple(int(a) for a in rng.integers(size // 20, margin, 2))
+            cv2.ellipse(card, center, axes, float(rng.uniform(0, 180)), 0, 360, _ink(rng), thickness, cv2.LINE_AA)
+        else:
+            corners = np.sort(rng.integers(margin, size - margin, (2, 2)), axis=0)
+            cv2.rectangle(card, tuple(int(c) for c in corners[0]), tuple(int(c) for c in corners[1]), _ink(rng), thickness)
+    return card
+
+
+def framed_card(card: MatLike) -> MatLike:
+    """`card` surrounded by the dark border the cards contours are found from."""
+    border = int(card.shape[0] * BORDER_RATIO)
+    return cv2.copyMakeBorder(card, border, border, border, border, cv2.BORDER_CONSTANT, value=(20, 20, 20))
+
+
+def enrollment_frame(card: MatLike) -> MatLike:
+    """Clean frame of `card` held straight in front of the camera, as when a user is created."""
+    framed = framed_card(card)
+    margin = framed.shape[0] // 4
+    return cv2.copyMakeBorder(framed, margin, margin, margin, margin, cv2.BORDER_CONSTANT, value=(235, 235, 235))
+
+
+def synthetic_frame(card: MatLike, rng: np.random.Generator, frame_size: Tuple[int, int] = (640, 480)) -> MatLike:
+    """
+    BGR camera-like frame of `card`: random position, size and perspective,
+    over a textured background, with a lighting change and sensor noise.
+    """
+    width, height = frame_size
+    background = np.full((height, width, 3), int(rng.integers(170, 235)), np.float32)
+    texture = cv2.GaussianBlur(rng.normal(0, 25, (height, width, 1)).astype(np.float32), (0, 0), 3)
+    frame = np.clip(background + texture[..., None], 0, 255).astype(np.uint8)
+
+    framed = framed_card(card)
+    side = rng.uniform(0.4, 0.65) * height
+    center = rng.uniform([side * 0.72, side * 0.72], [width - side * 0.72, height - side * 0.72])
+    angle = rng.uniform(-0.3, 0.3)
+    rotation = np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+    square = np.array([[-1, -1], [1, -1], [1, 1], [-1, 1]]) * side / 2
+    corners = square @ rotation.T + center + rng.normal(0, side * 0.03, (4, 2))
+    n = framed.shape[0]
+    src = np.float32([[0, 0], [n, 0], [n, n], [0, n]])
+    matrix = cv2.getPerspectiveTransform(src, corners.astype(np.float32))
+    cv2.warpPerspective(framed, matrix, (width, height), dst=frame, flags=cv2.INTER_AREA, borderMode=cv2.BORDER_TRANSPARENT)
+
+    # Lighting: global gain and a horizontal gradient
+    gain = rng.uniform(0.75, 1.15) + np.linspace(-1, 1, width, dtype=np.float32) * rng.uniform(-0.15, 0.15)
+    lit = frame.astype(np.float32) * gain[None, :, None]
+    lit += rng.normal(0, rng.uniform(2, 6), lit.shape).astype(np.float32)
+    frame = np.clip(lit, 0, 255).astype(np.uint8)
+    if rng.integers(2):
+        frame = cv2.GaussianBlur(frame, (3, 3), 0)
+    return frame
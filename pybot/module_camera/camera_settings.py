@@ -0,0 +1,63 @@
+import cv2
+from typing import NamedTuple, Tuple
+
+import logging
+
+_warning = logging.getLogger("CameraSettings").warning
+"""Custom Logger warning function. Print a message only shown when DEBUG mode is activated."""
+
+
+class CameraSettings(NamedTuple):
+    """Capture settings of a camera, None for the driver default."""
+
+    resolution: Tuple[int, int] | None = None
+    """(width, height) of the frames."""
+    fps: float | None = None
+    fourcc: str | None = None
+    """Pixel format, e.g. "MJPG" or "YUYV". MJPG allows higher resolutions and frame rates on USB webcams."""
+    buffer_size: int | None = None
+    """Number of frames buffered by the driver. 1 keeps the frames as fresh as possible."""
+
+
+def decode_fourcc(code: float) -> str | None:
+    code = int(code)
+    if code <= 0:
+        return None
+    return "".join(chr((code >> 8 * i) & 0xFF) for i in range(4))
+
+
+def read_settings(capture: cv2.VideoCapture) -> CameraSettings:
+    """Settings the camera actually uses, as reported by the driver."""
+    buffer_size = int(capture.get(cv2.CAP_PROP_BUFFERSIZE))
+    return CameraSettings(
+        resolution=(
+            int(capture.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        ),
+        fps=capture.get(cv2.CAP_PROP_FPS) or None,
+        fourcc=decode_fourcc(capture.get(cv2.CAP_PROP_FOURCC)),
+        buffer_size=buffer_size if buffer_size > 0 else None,
+    )
+
+
+def negotiate_settings(capture: cv2.VideoCapture, requested: CameraSettings) -> CameraSettings:
+    """
+    Ask the camera for the `requested` settings and return the ones it actually uses.
+    Drivers silently fall back to the nearest mode they support, so the result may differ.
+    """
+    # The pixel format first: it decides which resolutions and frame rates are available
+    if requested.fourcc is not None:
+        capture.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*requested.fourcc))
+    if requested.resolution is not None:
+        width, height = requested.resolution
+        capture.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        capture.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+    if requested.fps is not None:
+        capture.set(cv2.CAP_PROP_FPS, requested.fps)
+    if requested.buffer_size is not None:
+        capture.set(cv2.CAP_PROP_BUFFERSIZE, requested.buffer_size)
+    actual = read_settings(capture)
+    for field, value in requested._asdict().items():
+        if value is not None and getattr(actual, field) != value:
+            _warning(f"Camera {field} {value} requested, {getattr(actual, field)} used.")
+    return actual
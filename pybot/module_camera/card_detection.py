@@ -0,0 +1,151 @@
+from cardscan import (
+    scan,
+    card_contours_transform,
+    rotate_top_left_corner_low_density_transform,
+    perspective_crop,
+    rotate_top_left_corner_low_density,
+)
+import cv2
+import numpy as np
+from cv2.typing import MatLike
+from typing import List, NamedTuple, Tuple
+
+from .card_tracking import CardTracks
+from .match_cache import Match, MatchCache, candidate_fingerprint
+
+SCAN_MAX_SIZE = 640
+"""Longest side of the frame copy the cards contours are searched in. The cards images are still extracted from the full frame."""
+
+SCAN_CORNER_WINDOW = 2
+"""
+Half side, in pixels of the frame copy, of the window the corners found in it are refined in at the full
+resolution. Their error grows with the downscaling, about 1.5 pixels of the copy, e.g. 6 in a 1080p frame.
+"""
+
+
+class CardsDetection(NamedTuple):
+    """Cards found in a frame and the reference each one matched."""
+
+    contours: List[MatLike]
+    """Quadrilateral contour of each card found in the frame."""
+    candidate_images: List[MatLike]
+    """Perspective-corrected image of each card, in `contours` order."""
+    match_indices: List[int | None]
+    """Index of the matching reference of each card, None if it matches none."""
+    match_scores: List[float]
+    """Score of each card match, between 0 and 1 for every matcher, 0 if it matches none."""
+    generation: int
+    """`UserCardsTracker.generation` the indices refer to."""
+
+
+def refine_corners(frame: MatLike, contours: List[MatLike], half_window: int) -> List[MatLike]:
+    """
+    Move the corners of the `contours` found in `frame` to its intensity corners in a window of
+    `half_window` pixels around them, with a sub-pixel precision rounded to the nearest pixel.
+    A corner moved out of its window, e.g. on a finger holding the card, is kept as it was.
+    """
+    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_COUNT, 30, 0.01)
+    # Only the neighbourhood the window can move in is converted to grayscale
+    radius = 2 * half_window + 1
+    height, width = frame.shape[:2]
+    refined_contours = []
+    for contour in contours:
+        refined = contour.copy()
+        for corner in refined.reshape(-1, 2):
+            x, y = int(corner[0]), int(corner[1])
+            left, top = max(x - radius, 0), max(y - radius, 0)
+            region = frame[top : min(y + radius + 1, height), left : min(x + radius + 1, width)]
+            if region.shape[0] <= 2 * half_window + 5 or region.shape[1] <= 2 * half_window + 5:
+                # Too close to the frame border
+                continue
+            point = np.array([[[x - left, y - top]]], np.float32)
+            cv2.cornerSubPix(cv2.cvtColor(region, cv2.COLOR_BGR2GRAY), point, (half_window, half_window), (-1, -1), criteria)
+            dx, dy = point[0, 0] - (x - left, y - top)
+            if max(abs(dx), abs(dy)) <= half_window:
+                corner[:] = np.round((x + dx, y + dy))
+        refined_contours.append(refined)
+    return refined_contours
+
+
+def scan_cards(frame: MatLike, max_size: int | None = SCAN_MAX_SIZE) -> Tuple[List[MatLike], List[MatLike]]:
+    """
+    Find the cards contours in `frame`, halved until its longest side is at most `max_size`,
+    then refine their corners and extract each card image at the full `frame` resolution.
+
+    Returns
+        - contours: quadrilateral contour of each card, in `frame` coordinates
+        - candidate_images: perspective-corrected image of each card
+    """
+    small_frame, scale = frame, 1.0
+    while max_size is not None and max(small_frame.shape[:2]) > max_size:
+        # Halving is the fast path of the area interpolation
+        small_frame = cv2.resize(small_frame, None, fx=0.5, fy=0.5, interpolation=cv2.INTER_AREA)
+        scale /= 2
+    if scale == 1.0:
+        return scan(
+            frame,
+            keep_results=[
+                card_contours_transform,
+                rotate_top_left_corner_low_density_transform,
+            ],
+        )
+    (small_contours,) = scan(small_frame, keep_results=[card_contours_transform])
+    # Map the pixel centers back to the full frame
+    contours = [
+        np.round((contour + 0.5) / scale - 0.5).astype(np.int32)
+        for contour in small_contours
+    ]
+    contours = refine_corners(frame, contours, int(np.ceil(SCAN_CORNER_WINDOW / scale)))
+    candidate_images = [
+        rotate_top_left_corner_low_density(perspective_crop(contour, frame), corner_width_ratio=0.1)
+        for contour in contours
+    ]
+    return contours, candidate_images
+
+
+def detect_cards(frame: MatLike, matcher, min_threshold, stop_threshold, generation: int = 0, tracks: CardTracks | None = None, cache: MatchCache | None = None, scan_max_size: int | None = SCAN_MAX_SIZE) -> CardsDetection:
+    """
+    Find the cards in `frame` and match each of them with `matcher`.
+    Only depends on the matcher, so it can run outside of the `UserCardsTracker` process.
+
+    Params
+        - frame: 2D RGB Frame in pygame layout (width, height, 3), not modified
+        - matcher: matching backend, see `card_references.MATCHERS`
+        - min_threshold: Sufficient threshold to interpret frame as similar card
+        - stop_threshold: Threshold to interpret frame as corresponding card
+        - generation: the tracker generation of `matcher`
+        - tracks: cards followed over the previous frames, only the new,
+            moved or uncertain ones are matched again
+        - cache: results of the cards already matched, by fingerprint
+        - scan_max_size: see `scan_cards`, None to search the contours in the full frame
+    """
+    # Returns array of images in frame that seems to be a card
+    contours, candidate_images = scan_cards(frame, scan_max_size)
+
+    def match(images: List[MatLike]) -> List[Match]:
+        if cache is None:
+            return matcher.get_matches(images, min_threshold, stop_threshold)
+        keys = [(candidate_fingerprint(img), min_threshold, stop_threshold) for img in images]
+        matches: List[Match | None] = []
+        missed = []
+        for i, key in enumerate(keys):
+            cached, card_match = cache.get(key, generation)
+            matches.append(card_match)
+            if not cached:
+                missed.append(i)
+        if not missed:
+            return matches
+        # The cards not matched yet are matched together against the references
+        missed_matches = matcher.get_matches([images[i] for i in missed], min_threshold, stop_threshold)
+        for i, card_match in zip(missed, missed_matches):
+            cache.put(keys[i], generation, card_match)
+            matches[i] = card_match
+        return matches
+
+    if tracks is None:
+        matches = match(candidate_images)
+        match_indices = [idx for idx, _ in matches]
+        match_scores = [score for _, score in matches]
+    else:
+        match_indices, match_scores = tracks.update(contours, candidate_images, match, generation)
+    return CardsDetection(contours, candidate_images, match_indices, match_scores, generation)
@@ -0,0 +1,134 @@
+import csv
+import io
+import multiprocessing
+import os
+import cv2
+from cv2.typing import MatLike
+from typing import List, NamedTuple, Tuple
+
+from .card_detection import scan_cards
+from .processes import init_pool_worker
+
+ENROLLMENT_PICTURE_SIZE = (200, 200)
+"""Size of the enrolled cards pictures, the one of the cards found by `Robot.detecter_carte`."""
+
+ENROLLMENT_IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+"""Files of a directory read by `read_enrollments`, the formats the webapp accepts."""
+
+ENROLLMENT_CSV_COLUMNS = ("prenom", "nom", "carte")
+"""Columns of an enrollment CSV file: first name, last name and card image path, relative to the file directory."""
+
+ENROLLMENT_CSV_ENCODINGS = ("utf-8-sig", "cp1252")
+"""Encodings an enrollment CSV file is read with, in order: the first one decoding it is used, e.g. cp1252 for an Excel export."""
+
+MIN_CARD_ASPECT_RATIO = 0.8
+"""Narrowest image taken as a whole card when no card contour is found in it, the cards being square."""
+
+
+class Enrollment(NamedTuple):
+    """A user to create from the image of its card."""
+
+    first_name: str
+    last_name: str
+    path: str
+
+
+def read_enrollments(source: str) -> Tuple[List[Enrollment], List[str]]:
+    """
+    List the users to create from a directory of card images named `firstname_lastname.png`,
+    or from a CSV file with the `ENROLLMENT_CSV_COLUMNS` columns.
+    Raise OSError, e.g. FileNotFoundError, if `source` can not be read.
+
+    Returns
+        - the users to create
+        - an error message for each file or row that could not be read
+    """
+    enrollments, errors = [], []
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            stem, extension = os.path.splitext(name)
+            if extension.lower() not in ENROLLMENT_IMAGE_EXTENSIONS:
+                continue
+            first_name, _, last_name = stem.partition("_")
+            if not first_name or not last_name:
+                errors.append(f"{name}: expected a firstname_lastname file name")
+                continue
+            enrollments.append(Enrollment(first_name, last_name.replace("_", " "), os.path.join(source, name)))
+        return enrollments, errors
+    directory = os.path.dirname(source)
+    with open(source, "rb") as f:
+        content = f.read()
+    for encoding in ENROLLMENT_CSV_ENCODINGS:
+        try:
+            text = content.decode(encoding)
+            break
+        except UnicodeDecodeError:
+            continue
+    else:
+        return [], [f"{source}: unknown text encoding, expected one of {list(ENROLLMENT_CSV_ENCODINGS)}"]
+    reader = csv.DictReader(io.StringIO(text, newline=""))
+    try:
+        missing = set(ENROLLMENT_CSV_COLUMNS) - set(reader.fieldnames or ())
+        if missing:
+            return [], [f"{source}: missing columns {sorted(missing)}"]
+        for row in reader:
+            # The fields missing from a short row are None
+            fields = [row[column] for column in ENROLLMENT_CSV_COLUMNS]
+            if None in fields:
+                errors.append(f"{source} line {reader.line_num}: missing field")
+                continue
+            first_name, last_name, path = (field.strip() for field in fields)
+            if not first_name or not last_name or not path:
+                errors.append(f"{source} line {reader.line_num}: empty field")
+                continue
+            enrollments.append(Enrollment(first_name, last_name, os.path.join(directory, path)))
+    except csv.Error as e:
+        errors.append(f"{source} line {reader.line_num}: {e}")
+    return enrollments, errors
+
+
+def enrollment_picture(image: MatLike) -> MatLike | None:
+    """
+    Picture to enroll from a BGR `image`: the largest card found in it, else the whole
+    image if it is already the picture of a card. None if it is not.
+    """
+    contours, candidate_images = scan_cards(image)
+    if candidate_images:
+        largest = max(range(len(contours)), key=lambda i: cv2.contourArea(contours[i]))
+        card = candidate_images[largest]
+    else:
+        height, width = image.shape[:2]
+        if min(height, width) / max(height, width) < MIN_CARD_ASPECT_RATIO:
+            return None
+        card = image
+    return cv2.resize(card, ENROLLMENT_PICTURE_SIZE, interpolation=cv2.INTER_AREA)
+
+
+def _prepare_enrollment(enrollment: Enrollment) -> Tuple[bytes | None, str | None]:
+    """Return the PNG encoded picture of `enrollment`, or None with the reason it was rejected."""
+    image = cv2.imread(enrollment.path)
+    if image is None:
+        return None, f"{enrollment.path}: image could not be read"
+    picture = enrollment_picture(image)
+    if picture is None:
+        return None, f"{enrollment.path}: no card found"
+    ok, png = cv2.imencode(".png", picture)
+    if not ok:
+        return None, f"{enrollment.path}: picture could not be encoded"
+    return png.tobytes(), None
+
+
+def prepare_enrollments(enrollments: List[Enrollment], processes: int | None = None) -> List[Tuple[bytes | None, str | None]]:
+    """
+    Read, validate and crop the card image of each enrollment in a pool of `processes`
+    processes, one per core if not given.
+
+    Returns
+        - for each enrollment, in order, its PNG encoded picture, or None with the reason it was rejected
+    """
+    if not enrollments:
+        return []
+    # "fork" does not re-run the user script, see `CardDetectionWorker`
+    context = multiprocessing.get_context("fork")
+    with context.Pool(processes, initializer=init_pool_worker) as pool:
+        return pool.map(_prepare_enrollment, enrollments, chunksize=4)
@@ -0,0 +1,184 @@
+import itertools
+from collections import deque
+from typing import Callable, Dict, List, Tuple
+
+from .compare_images import ImageComparator
+from .orb_matcher import OrbCardMatcher
+from .marker_matcher import MarkerMatcher
+from .reference_cache import ReferenceCache
+
+HASH_PREFILTER_TOP_K = 32
+"""Number of users cards, nearest by perceptual hash, compared with SSIM first to a detected card."""
+
+THUMBNAIL_FALLBACK_TOP_K = 64
+"""Number of users cards, best correlated by thumbnail, compared with SSIM to a detected card matching none of the `HASH_PREFILTER_TOP_K` ones."""
+
+SSIM_PYRAMID_SIZES = ((16, 16), (32, 32))
+"""Coarse sizes the users cards are scored at before the full comparison size, see `ImageComparator`."""
+
+MATCHERS: Dict[str, Callable] = {
+    "ssim": lambda references: ImageComparator(
+        references.image_paths,
+        prefilter_k=HASH_PREFILTER_TOP_K,
+        fallback_k=THUMBNAIL_FALLBACK_TOP_K,
+        pyramid_sizes=SSIM_PYRAMID_SIZES,
+        ref_images=references.reference_cache.load(references.user_ids, references.image_paths),
+        priorities=references.priorities,
+    ),
+    "orb": lambda references: OrbCardMatcher(references.image_paths),
+    "aruco": lambda references: MarkerMatcher(references.marker_ids, references.get_matcher("ssim")),
+}
+"""Available card matching backends, built from a `CardReferences`."""
+
+USER_ID_MATCHERS = ("aruco",)
+"""Backends of `MATCHERS` built from the users markers: built again on first use when the users change, instead of updated."""
+
+PRIORITY_MATCHERS = ("ssim",)
+"""Backends of `MATCHERS` holding the priority of each user card, see `CardReferences.set_priorities`."""
+
+CHANGES_KEPT = 64
+"""Number of the last changes of the references kept to update their copies, see `CardReferences.changes_since`."""
+
+Change = Tuple
+"""(kind, *arguments) of a change of the references, e.g. ("remove", idx)."""
+
+_generations = itertools.count()
+"""Shared by all the references so a generation never designates 2 different users lists."""
+
+
+class CardReferences:
+    """
+    The users cards the detected cards are matched against, and the matchers built from them.
+
+    They only hold what the matchers are built from, not the database users: a detection
+    worker keeps its own copy, built again from `changes_since` instead of receiving the
+    matchers, which would take the render loop a pickling pause per user change.
+    """
+
+    def __init__(self, user_ids: List[int], image_paths: List[str], marker_ids: List[int | None], priorities: List[float], cache_dir: str):
+        """
+        Params
+            - user_ids, image_paths: id and card picture path of each user
+            - marker_ids: marker id of each user, None if it has none, see `MarkerMatcher`
+            - priorities: priority of each user card, see `ImageComparator`
+            - cache_dir: directory of the `ReferenceCache`
+        """
+        self.user_ids = list(user_ids)
+        self.image_paths = list(image_paths)
+        self.marker_ids = list(marker_ids)
+        self.priorities = list(priorities)
+        self.reference_cache = ReferenceCache(cache_dir)
+        self.matchers = {}
+        """Matching backends already built, the other ones are built on first use."""
+        self.generation = next(_generations)
+        """Changes each time the users cards change."""
+        self.priorities_version = 0
+        """Changes each time `set_priorities` is called."""
+        self._changes: deque = deque(maxlen=CHANGES_KEPT)
+        """(generation before, generation after, change) of the last changes."""
+
+    def __getstate__(self):
+        # The matchers are built again by the process the references are sent to
+        state = self.__dict__.copy()
+        state["matchers"] = {}
+        state["_changes"] = deque(maxlen=CHANGES_KEPT)
+        return state
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def get_matcher(self, method: str):
+        """Return the `method` matching backend. Raise ValueError if it does not exist."""
+        if method not in MATCHERS:
+            raise ValueError(f"Unknown card matching method '{method}', expected one of {list(MATCHERS)}")
+        if method not in self.matchers:
+            self.matchers[method] = MATCHERS[method](self)
+        return self.matchers[method]
+
+    def _forget_user_id_matchers(self):
+        for method in USER_ID_MATCHERS:
+            self.matchers.pop(method, None)
+
+    def _add(self, user_id: int, image_path: str, marker_id: int | None, priority: float):
+        self._forget_user_id_matchers()
+        self.user_ids.append(user_id)
+        self.image_paths.append(image_path)
+        self.marker_ids.append(marker_id)
+        self.priorities.append(priority)
+        for method, matcher in self.matchers.items():
+            if method in PRIORITY_MATCHERS:
+                matcher.add_reference(image_path, priority)
+            else:
+                matcher.add_reference(image_path)
+
+    def _remove(self, idx: int):
+        self._forget_user_id_matchers()
+        del self.user_ids[idx]
+        del self.image_paths[idx]
+        del self.marker_ids[idx]
+        del self.priorities[idx]
+        for matcher in self.matchers.values():
+            matcher.remove_reference(idx)
+
+    def _update(self, idx: int, user_id: int, image_path: str, marker_id: int | None):
+        self._forget_user_id_matchers()
+        self.user_ids[idx] = user_id
+        self.image_paths[idx] = image_path
+        self.marker_ids[idx] = marker_id
+        for matcher in self.matchers.values():
+            matcher.update_reference(idx, image_path)
+
+    def _set_marker_id(self, idx: int, marker_id: int | None):
+        self._forget_user_id_matchers()
+        self.marker_ids[idx] = marker_id
+
+    def _apply(self, change: Change, generation: int | None = None):
+        """Apply `change` and move to `generation`, a new one if not given."""
+        kind, *args = change
+        getattr(self, f"_{kind}")(*args)
+        previous = self.generation
+        self.generation = next(_generations) if generation is None else generation
+        self._changes.append((previous, self.generation, change))
+
+    def add(self, user_id: int, image_path: str, marker_id: int | None = None, priority: float = 0.0):
+        """Append the card of the user `user_id`."""
+        self._apply(("add", user_id, image_path, marker_id, priority))
+
+    def remove(self, idx: int):
+        """Remove the user card at index `idx`. The following cards indices are shifted down."""
+        self._apply(("remove", idx))
+
+    def update(self, idx: int, user_id: int, image_path: str, marker_id: int | None):
+        """Replace the user card at index `idx`."""
+        self._apply(("update", idx, user_id, image_path, marker_id))
+
+    def set_marker_id(self, idx: int, marker_id: int | None):
+        """Set the marker id of the user card at index `idx`."""
+        self._apply(("set_marker_id", idx, marker_id))
+
+    def set_priorities(self, priorities: List[float]):
+        """Set the priority of each user card. The indices stay valid, the generation does not change."""
+        self.priorities = list(priorities)
+        for method in PRIORITY_MATCHERS:
+            if method in self.matchers:
+                self.matchers[method].set_priorities(self.priorities)
+        self.priorities_version += 1
+
+    def changes_since(self, generation: int | None) -> List[Tuple[int, int, Change]] | None:
+        """
+        Return the changes from the references of `generation` to these ones, to pass to
+        `apply_changes` on a copy of them. None if they are not all kept anymore, or these
+        references do not come from the ones of `generation`.
+        """
+        if generation == self.generation:
+            return []
+        changes = list(self._changes)
+        for start, (previous, _, _) in enumerate(changes):
+            if previous == generation:
+                return changes[start:]
+        return None
+
+    def apply_changes(self, changes: List[Tuple[int, int, Change]]):
+        """Apply the `changes_since` the generation of these references, made on another copy."""
+        for _, generation, change in changes:
+            self._apply(change, generation)
@@ -0,0 +1,213 @@
+import cv2
+import numpy as np
+from collections import Counter, deque
+from cv2.typing import MatLike
+from typing import Callable, Dict, List, Tuple
+
+from .match_cache import Match
+
+Box = Tuple[int, int, int, int]
+"""Bounding rectangle (x, y, width, height) of a contour."""
+
+
+def card_thumbnail(card_img: MatLike, size=(16, 16)) -> MatLike:
+    """Tiny grayscale version of a card image, to notice when another card takes its place."""
+    small = cv2.resize(card_img, size, interpolation=cv2.INTER_AREA)
+    if small.ndim == 3:
+        small = cv2.cvtColor(small, cv2.COLOR_RGB2GRAY)
+    return small
+
+
+def box_iou(a: Box, b: Box) -> float:
+    """Intersection over union of 2 boxes."""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    inter_w = min(ax + aw, bx + bw) - max(ax, bx)
+    inter_h = min(ay + ah, by + bh) - max(ay, by)
+    if inter_w <= 0 or inter_h <= 0:
+        return 0.0
+    inter = inter_w * inter_h
+    return inter / (aw * ah + bw * bh - inter)
+
+
+class CardTrack:
+    """A card followed across frames, with the identities it was matched to on its last frames."""
+
+    def __init__(self, box: Box, history: int):
+        self.box = box
+        """Box of the card in the last frame it was seen."""
+        self.matched_box: Box | None = None
+        """Box of the card the last time it was matched."""
+        self.matched_thumbnail: MatLike | None = None
+        """Thumbnail of the card image the last time it was matched."""
+        self.votes = deque(maxlen=history)
+        """Last matched reference indices, None when it matched no reference."""
+        self.scores = deque(maxlen=history)
+        """Score of each of the `votes`."""
+        self.missed = 0
+        """Number of consecutive frames the card was not found in."""
+
+    @property
+    def identity(self) -> int | None:
+        """The reference index most voted for."""
+        if not self.votes:
+            return None
+        return Counter(self.votes).most_common(1)[0][0]
+
+    @property
+    def confidence(self) -> float:
+        """Share of the votes for `identity`."""
+        if not self.votes:
+            return 0.0
+        return self.votes.count(self.identity) / len(self.votes)
+
+    @property
+    def score(self) -> float:
+        """Mean score of the votes for `identity`, 0 if it is None."""
+        identity = self.identity
+        if identity is None:
+            return 0.0
+        return float(np.mean([score for vote, score in zip(self.votes, self.scores) if vote == identity]))
+
+    def vote(self, match: Match):
+        idx, score = match
+        self.votes.append(idx)
+        self.scores.append(score)
+
+    def clear_votes(self):
+        self.votes.clear()
+        self.scores.clear()
+
+
+class CardTracks:
+    """
+    Follow the cards found by consecutive scans from the overlap of their boxes,
+    so a card is only matched again when it is new, moved, or its identity is uncertain.
+    """
+
+    def __init__(
+        self,
+        iou_threshold: float = 0.5,
+        moved_iou: float = 0.8,
+        changed_threshold: float = 8.0,
+        history: int = 5,
+        min_votes: int = 3,
+        min_confidence: float = 0.6,
+        max_missed: int = 5,
+    ):
+        """
+        Params
+            - iou_threshold: minimum overlap for a card to continue a track
+            - moved_iou: a card overlapping less its box of last match is matched again
+            - changed_threshold: a card whose thumbnail differs more, in mean between 0 and 255,
+                from its thumbnail of last match is matched again
+            - history: number of identity votes kept per track
+            - min_votes: a track is matched on each frame until it has as many votes
+            - min_confidence: a track is matched again while its identity has a lower share of the votes
+            - max_missed: number of frames a track is kept without seeing its card
+        """
+        self.iou_threshold = iou_threshold
+        self.moved_iou = moved_iou
+        self.changed_threshold = changed_threshold
+        self.history = history
+        self.min_votes = min_votes
+        self.min_confidence = min_confidence
+        self.max_missed = max_missed
+        self.tracks: List[CardTrack] = []
+        self.generation = None
+        """Generation of the matcher the votes were made with."""
+        self.matches_run = 0
+        self.matches_reused = 0
+
+    def _needs_match(self, track: CardTrack, thumbnail: MatLike) -> bool:
+        if (
+            track.matched_thumbnail is not None
+            and np.mean(cv2.absdiff(thumbnail, track.matched_thumbnail)) > self.changed_threshold
+        ):
+            # Another card took its place, the previous votes are not about this one
+            track.clear_votes()
+            return True
+        return (
+            len(track.votes) < self.min_votes
+            or track.confidence < self.min_confidence
+            or box_iou(track.box, track.matched_box) < self.moved_iou
+        )
+
+    def _associate(self, boxes: List[Box]) -> Dict[int, int]:
+        """Greedily pair each box with the track it overlaps the most. Return {box index: track index}."""
+        pairs = sorted(
+            (
+                (box_iou(track.box, box), box_idx, track_idx)
+                for box_idx, box in enumerate(boxes)
+                for track_idx, track in enumerate(self.tracks)
+            ),
+            reverse=True,
+        )
+        associations = {}
+        used_tracks = set()
+        for iou, box_idx, track_idx in pairs:
+            if iou < self.iou_threshold:
+                break
+            if box_idx in associations or track_idx in used_tracks:
+                continue
+            associations[box_idx] = track_idx
+            used_tracks.add(track_idx)
+        return associations
+
+    def update(
+        self,
+        contours: List[MatLike],
+        candidate_images: List[MatLike],
+        match: Callable[[List[MatLike]], List[Match]],
+        generation: int,
+    ) -> Tuple[List[int | None], List[float]]:
+        """
+        Follow the cards of a new frame and return their identity.
+
+        Params
+            - contours, candidate_images: the cards found in the frame
+            - match: return the reference index, None if none matches, and the score of each of
+                the card images given, called once per frame with all the cards to match
+            - generation: generation of the references `match` uses, tracks are reset when it changes
+        Returns
+            - the reference index of each card, in `contours` order
+            - the score of each card identity, see `CardTrack.score`
+        """
+        if generation != self.generation:
+            self.tracks = []
+            self.generation = generation
+        boxes = [cv2.boundingRect(contour) for contour in contours]
+        associations = self._associate(boxes)
+        tracks = []
+        to_match = []
+        for box_idx, (box, candidate_img) in enumerate(zip(boxes, candidate_images)):
+            if box_idx in associations:
+                track = self.tracks[associations[box_idx]]
+            else:
+                track = CardTrack(box, self.history)
+            track.box = box
+            track.missed = 0
+            thumbnail = card_thumbnail(candidate_img)
+            if self._needs_match(track, thumbnail):
+                track.matched_box = box
+                track.matched_thumbnail = thumbnail
+                to_match.append(box_idx)
+                self.matches_run += 1
+            else:
+                self.matches_reused += 1
+            tracks.append(track)
+        if to_match:
+            matches = match([candidate_images[box_idx] for box_idx in to_match])
+            for box_idx, card_match in zip(to_match, matches):
+                tracks[box_idx].vote(card_match)
+        identities = [track.identity for track in tracks]
+        scores = [track.score for track in tracks]
+        # Keep the tracks of cards hidden for a few frames
+        seen = set(associations.values())
+        for track_idx, track in enumerate(self.tracks):
+            if track_idx not in seen:
+                track.missed += 1
+                if track.missed <= self.max_missed:
+                    tracks.append(track)
+        self.tracks = tracks
+        return identities, scores
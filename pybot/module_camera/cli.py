@@ -0,0 +1,6 @@
+import sys
+
+
+def log(message: str):
+    """Print a progress `message` of a command line tool on stderr, keeping stdout for its results."""
+    print(message, file=sys.stderr, flush=True)
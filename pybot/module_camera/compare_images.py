@@ -1,35 +1,431 @@
-from skimage.metrics import structural_similarity as ssim
 import cv2
+import numpy as np
 from cv2.typing import MatLike
-from typing import List, Tuple
+from typing import Iterator, List, Tuple
+from .perceptual_hash import HammingIndex, dhash
 
 import logging
 
 _warning = logging.getLogger("CompareImage").warning
 """Custom Logger warning function. Print a message only shown when DEBUG mode is activated."""
 
+SSIM_WIN_SIZE = 7
+"""Side of the square sliding window, same default as `skimage.metrics.structural_similarity`."""
+
+SSIM_DATA_RANGE = 255
+"""Dynamic range of the compared grayscale uint8 images."""
+
+_SSIM_C1 = (0.01 * SSIM_DATA_RANGE) ** 2
+_SSIM_C2 = (0.03 * SSIM_DATA_RANGE) ** 2
+_SSIM_COV_NORM = SSIM_WIN_SIZE**2 / (SSIM_WIN_SIZE**2 - 1)
+"""Sample covariance normalisation, as skimage does by default."""
+
+SSIM_CHUNK_SIZE = 256
+"""Number of references scored at once, for all the candidates. Bounds the temporary memory and lets the search stop early on `stop_threshold`."""
+
+SSIM_FIRST_CHUNK_SIZE = 16
+"""Number of references of highest priority scored first, the others are only scored if none reaches `stop_threshold`."""
+
+PYRAMID_PRUNE_MARGIN = 0.2
+"""
+How far under `min_threshold` a reference can score at a coarse pyramid level and still be scored at the next one.
+Downscaling smooths the cards, so a matching card scores higher on coarse levels than on the full size.
+"""
+
+THUMBNAIL_SIZE = (8, 8)
+"""Size of the thumbnails the references are shortlisted with when the hash prefilter misses, see `thumbnail_vectors`."""
+
+
+def box_mean(imgs: np.ndarray, win_size: int = SSIM_WIN_SIZE) -> np.ndarray:
+    """
+    Mean of every `win_size`x`win_size` window lying fully inside the images, on the 2 last axes.
+    Equivalent to the skimage uniform filter once the borders are cropped, as its SSIM does.
+    """
+    h, w = imgs.shape[-2:]
+    summed = np.zeros(imgs.shape[:-2] + (h + 1, w + 1), dtype=np.float64)
+    np.cumsum(imgs, axis=-2, dtype=np.float64, out=summed[..., 1:, 1:])
+    np.cumsum(summed, axis=-1, out=summed)
+    windows = (
+        summed[..., win_size:, win_size:]
+        - summed[..., :-win_size, win_size:]
+        - summed[..., win_size:, :-win_size]
+        + summed[..., :-win_size, :-win_size]
+    )
+    return windows / win_size**2
+
+
+def ssim_statistics(imgs: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the blurred mean maps and the variance maps of grayscale `imgs`, the part of SSIM that only depends on one image."""
+    mean = box_mean(imgs)
+    var = _SSIM_COV_NORM * (box_mean(np.square(imgs, dtype=np.float64)) - mean * mean)
+    return mean, var
+
+
+def batched_ssim(
+    img: np.ndarray,
+    img_mean: np.ndarray,
+    img_var: np.ndarray,
+    refs: np.ndarray,
+    refs_mean: np.ndarray,
+    refs_var: np.ndarray,
+) -> np.ndarray:
+    """
+    Score `img` against every image of the `refs` stack in one vectorized pass.
+    Gives the same values as calling `skimage.metrics.structural_similarity` on each pair.
+
+    Params
+        - img: 2D grayscale image, or stack of N images, each scored against the reference of same index
+        - img_mean, img_var: `ssim_statistics` of `img`
+        - refs: stack of grayscale images, shape (N, height, width)
+        - refs_mean, refs_var: `ssim_statistics` of `refs`
+    Returns
+        - array of the N SSIM scores
+    """
+    covar = _SSIM_COV_NORM * (
+        box_mean(refs * img.astype(np.float64)) - refs_mean * img_mean
+    )
+    numerator = (2 * refs_mean * img_mean + _SSIM_C1) * (2 * covar + _SSIM_C2)
+    denominator = (refs_mean * refs_mean + img_mean * img_mean + _SSIM_C1) * (
+        refs_var + img_var + _SSIM_C2
+    )
+    return (numerator / denominator).mean(axis=(-2, -1))
+
+
+def downscale(imgs: np.ndarray, size: Tuple[int, int]) -> np.ndarray:
+    """Resize an image, or each image of a stack, to `size` with area interpolation."""
+    if imgs.ndim == 2:
+        return cv2.resize(imgs, size, interpolation=cv2.INTER_AREA)
+    width, height = size
+    small = np.empty((len(imgs), height, width), np.uint8)
+    for i, img in enumerate(imgs):
+        cv2.resize(img, size, dst=small[i], interpolation=cv2.INTER_AREA)
+    return small
+
+
+def thumbnail_vectors(imgs: np.ndarray) -> np.ndarray:
+    """
+    `THUMBNAIL_SIZE` thumbnails of a stack of grayscale images as zero-mean unit vectors, shape (N, width * height).
+    The dot product of 2 of them is the correlation of the thumbnails, scored against a whole stack in one product.
+    """
+    vectors = downscale(imgs, THUMBNAIL_SIZE).reshape(len(imgs), -1).astype(np.float32)
+    vectors -= vectors.mean(axis=1, keepdims=True)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-6)
+
+
+def load_comparison_img(path: str, size: Tuple[int, int]) -> MatLike | None:
+    """Load the picture at `path` for comparison. Resize and grayscale. None if it fails to load."""
+    img = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    if img is None:
+        _warning(f"Image at path {path} failed to load.")
+        return None
+    return cv2.resize(img, size)
+
 
 class ImageComparator:
-    def __init__(self, paths: List[str], compare_size=(64, 64)):
+    def __init__(
+        self,
+        paths: List[str],
+        compare_size=(64, 64),
+        prefilter_k: int | None = None,
+        ref_images: List[MatLike | None] | None = None,
+        pyramid_sizes: Tuple[Tuple[int, int], ...] = (),
+        priorities: List[float] | None = None,
+        fallback_k: int | None = None,
+    ):
+        """
+        Params
+            - paths: pictures of the reference cards
+            - compare_size: size the images are resized to before comparison
+            - prefilter_k: if set, only the `prefilter_k` references with the
+                nearest perceptual hash are compared with SSIM first. The other
+                references are compared too if none of them reaches `min_threshold`.
+            - ref_images: the `paths` pictures already resized and grayscaled,
+                e.g. from a `ReferenceCache`. Loaded from `paths` if not given.
+            - pyramid_sizes: sizes smaller than `compare_size`, coarsest first, the
+                references are scored at before `compare_size`. Only the references
+                scoring at least `min_threshold - PYRAMID_PRUNE_MARGIN` on a level
+                are scored on the next one.
+            - priorities: priority of each reference, e.g. from its past matches. The
+                references are searched by decreasing priority, then in `paths` order.
+            - fallback_k: if set with `prefilter_k`, the references compared after the
+                prefiltered ones are only the `fallback_k` ones whose thumbnail
+                correlates best with the card, see `get_matches`.
+        """
         self.compare_size = compare_size
-        self.ref_images: List[MatLike] = self._prepare_comparison_img(
-            paths, compare_size
-        )
+        self.prefilter_k = prefilter_k
+        self.fallback_k = fallback_k
+        self.pyramid_sizes = pyramid_sizes
+        if ref_images is None:
+            ref_images = self._prepare_comparison_img(paths, compare_size)
+        self.ref_images: List[MatLike] = ref_images
+        self._priorities = np.zeros(len(ref_images))
+        """Priority of each reference, indexed as `self.ref_images`."""
+        if priorities is not None:
+            self._priorities[:] = priorities
+        self._build_references()
 
     @staticmethod
     def _prepare_comparison_img(
         paths: List[str], size: Tuple[int, int]
     ) -> List[MatLike]:
         """Load the picture for comparison. Resize and grayscale."""
-        imgs = []
-        for path in paths:
-            img = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
-            if img is not None:
-                img = cv2.resize(img, size)
-            else:
-                _warning(f"Image at path {path} failed to load.")
-            imgs.append(img)
-        return imgs
+        return [load_comparison_img(path, size) for path in paths]
+
+    def _build_references(self):
+        """
+        Stack the loaded `self.ref_images` in one contiguous array and precompute their SSIM statistics.
+        `self._ref_indices` maps a row of the stack to its index in `self.ref_images`.
+        """
+        self._ref_indices = np.array(
+            [i for i, img in enumerate(self.ref_images) if img is not None],
+            dtype=np.intp,
+        )
+        width, height = self.compare_size
+        refs = [self.ref_images[i] for i in self._ref_indices]
+        self._refs = np.ascontiguousarray(
+            np.stack(refs) if refs else np.empty((0, height, width), np.uint8)
+        )
+        self._refs_mean, self._refs_var = ssim_statistics(self._refs)
+        self._hash_index = HammingIndex(dhash(self._refs))
+        self._thumbnails = thumbnail_vectors(self._refs)
+        """`thumbnail_vectors` of the references, rows as `self._refs`."""
+        self._pyramid = []
+        """Stack, mean and variance of the references for each size of `self.pyramid_sizes`, rows as `self._refs`."""
+        for size in self.pyramid_sizes:
+            level_refs = downscale(self._refs, size)
+            self._pyramid.append([level_refs, *ssim_statistics(level_refs)])
+
+    def _insert_reference_row(self, idx: int, img: MatLike):
+        """Insert `img`, the reference at index `idx` of `self.ref_images`, in the stack keeping `self.ref_images` order."""
+        row = int(np.searchsorted(self._ref_indices, idx))
+        mean, var = ssim_statistics(img)
+        self._refs = np.insert(self._refs, row, img, axis=0)
+        self._refs_mean = np.insert(self._refs_mean, row, mean, axis=0)
+        self._refs_var = np.insert(self._refs_var, row, var, axis=0)
+        self._hash_index.hashes = np.insert(self._hash_index.hashes, row, dhash(img), axis=0)
+        self._thumbnails = np.insert(self._thumbnails, row, thumbnail_vectors(img[None]), axis=0)
+        for level, size in zip(self._pyramid, self.pyramid_sizes):
+            small = downscale(img, size)
+            for i, array in enumerate((small, *ssim_statistics(small))):
+                level[i] = np.insert(level[i], row, array, axis=0)
+        self._ref_indices = np.insert(self._ref_indices, row, idx)
+
+    def _delete_reference_row(self, row: int):
+        self._refs = np.delete(self._refs, row, axis=0)
+        self._refs_mean = np.delete(self._refs_mean, row, axis=0)
+        self._refs_var = np.delete(self._refs_var, row, axis=0)
+        self._hash_index.hashes = np.delete(self._hash_index.hashes, row, axis=0)
+        self._thumbnails = np.delete(self._thumbnails, row, axis=0)
+        for level in self._pyramid:
+            for i, array in enumerate(level):
+                level[i] = np.delete(array, row, axis=0)
+        self._ref_indices = np.delete(self._ref_indices, row)
+
+    def set_priorities(self, priorities: List[float]):
+        """Set the priority of each reference, indexed as `self.ref_images`, see `__init__`."""
+        self._priorities[:] = priorities
+
+    def _search_order(self, rows: np.ndarray) -> np.ndarray:
+        """`rows` of the stack by decreasing priority, keeping their order on ties."""
+        order = np.argsort(-self._priorities[self._ref_indices[rows]], kind="stable")
+        return rows[order]
+
+    def add_reference(self, path: str, priority: float = 0.0):
+        """Load the picture at `path` and append it to the references."""
+        img = load_comparison_img(path, self.compare_size)
+        self.ref_images.append(img)
+        self._priorities = np.append(self._priorities, priority)
+        if img is not None:
+            self._insert_reference_row(len(self.ref_images) - 1, img)
+
+    def remove_reference(self, idx: int):
+        """Remove the reference at index `idx` of `self.ref_images`. The following references indices are shifted down."""
+        del self.ref_images[idx]
+        self._priorities = np.delete(self._priorities, idx)
+        rows = np.flatnonzero(self._ref_indices == idx)
+        if rows.size:
+            self._delete_reference_row(rows[0])
+        self._ref_indices[self._ref_indices > idx] -= 1
+
+    def update_reference(self, idx: int, path: str):
+        """Replace the reference at index `idx` of `self.ref_images` by the picture at `path`."""
+        img = load_comparison_img(path, self.compare_size)
+        self.ref_images[idx] = img
+        rows = np.flatnonzero(self._ref_indices == idx)
+        if rows.size and img is not None:
+            row = rows[0]
+            self._refs[row] = img
+            self._refs_mean[row], self._refs_var[row] = ssim_statistics(img)
+            self._hash_index.hashes[row] = dhash(img)
+            self._thumbnails[row] = thumbnail_vectors(img[None])[0]
+            for level, size in zip(self._pyramid, self.pyramid_sizes):
+                small = downscale(img, size)
+                level[0][row] = small
+                level[1][row], level[2][row] = ssim_statistics(small)
+        elif rows.size:
+            self._delete_reference_row(rows[0])
+        elif img is not None:
+            self._insert_reference_row(idx, img)
+
+    def _prepare_candidate(self, frame: MatLike) -> MatLike:
+        """Grayscale and resize a detected card to the references format."""
+        frame_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return cv2.resize(frame_gray, self.compare_size)
+
+    def _prune_pairs(self, frames_pyramid: List[Tuple[np.ndarray, ...]], candidates: np.ndarray, rows: np.ndarray, prune_below: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Keep the (candidate, row) pairs scoring at least `prune_below` on every pyramid level.
+        `frames_pyramid` holds the candidates stack, mean and variance of each level.
+        """
+        for (small, small_mean, small_var), (level_refs, level_mean, level_var) in zip(frames_pyramid, self._pyramid):
+            if not rows.size:
+                break
+            similarities = batched_ssim(
+                small[candidates],
+                small_mean[candidates],
+                small_var[candidates],
+                level_refs[rows],
+                level_mean[rows],
+                level_var[rows],
+            )
+            keep = similarities >= prune_below
+            candidates, rows = candidates[keep], rows[keep]
+        return candidates, rows
+
+    def _search_rows(self, frames_gray: np.ndarray, shortlist: str | None = "hash") -> np.ndarray:
+        """
+        Rows of the references each of the prepared `frames_gray` is scored against, by decreasing priority, shape (C, K).
+        With the "hash" `shortlist`, the `self.prefilter_k` ones of nearest hash. With the "thumbnail" one, the
+        `self.fallback_k` ones of best correlated thumbnail. All of them if the shortlist is None or not set.
+        """
+        k = {"hash": self.prefilter_k, "thumbnail": self.fallback_k}.get(shortlist)
+        if k is None or k >= len(self._refs):
+            rows = self._search_order(np.arange(len(self._refs)))
+            return np.broadcast_to(rows, (len(frames_gray), len(rows)))
+        if shortlist == "hash":
+            shortlists = [self._hash_index.nearest(frame_hash, k) for frame_hash in dhash(frames_gray)]
+        else:
+            correlations = self._thumbnails @ thumbnail_vectors(frames_gray).T
+            # In ascending row order, as the hash ones, so the priority ties keep the references order
+            shortlists = [np.sort(np.argpartition(-column, k)[:k]) for column in correlations.T]
+        return np.array([self._search_order(rows) for rows in shortlists]).reshape(len(frames_gray), -1)
+
+    def _iter_batch_scores(
+        self,
+        frames: List[MatLike],
+        prune_below: float | None = None,
+        active: np.ndarray | None = None,
+        shortlist: str | None = "hash",
+    ) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """
+        Yield `(candidates, rows, similarities)`: the SSIM scores of (candidate, reference) pairs, the
+        candidates being indices of `frames` and the references rows of the stack. The pairs of all the
+        candidates are scored together, chunk by chunk by decreasing priority, the `SSIM_FIRST_CHUNK_SIZE`
+        first references of each candidate in a chunk of their own. In a chunk, the pairs are grouped by
+        candidate, then in search order.
+        Only the references of the candidate `shortlist` are scored, see `_search_rows`.
+        With `prune_below` and `self.pyramid_sizes`, only the pairs scoring at least `prune_below` on the
+        coarse levels are scored at `self.compare_size`.
+        The candidates set to False in `active` are not scored on the next chunks.
+        """
+        if active is None:
+            active = np.ones(len(frames), dtype=bool)
+        frames_gray = np.stack([self._prepare_candidate(frame) for frame in frames])
+        frames_mean, frames_var = ssim_statistics(frames_gray)
+        prune = bool(self._pyramid) and prune_below is not None
+        if prune:
+            frames_pyramid = [
+                (small, *ssim_statistics(small))
+                for small in (downscale(frames_gray, size) for size in self.pyramid_sizes)
+            ]
+        search_rows = self._search_rows(frames_gray, shortlist)
+        columns = [slice(0, SSIM_FIRST_CHUNK_SIZE)] + [
+            slice(start, start + SSIM_CHUNK_SIZE)
+            for start in range(SSIM_FIRST_CHUNK_SIZE, search_rows.shape[1], SSIM_CHUNK_SIZE)
+        ]
+        for column in columns:
+            active_candidates = np.flatnonzero(active)
+            if not active_candidates.size:
+                return
+            chunk_rows = search_rows[active_candidates, column]
+            candidates = np.repeat(active_candidates, chunk_rows.shape[1])
+            rows = chunk_rows.ravel()
+            if prune:
+                candidates, rows = self._prune_pairs(frames_pyramid, candidates, rows, prune_below)
+            # Score at most SSIM_CHUNK_SIZE pairs at once
+            for start in range(0, len(rows), SSIM_CHUNK_SIZE):
+                pairs = slice(start, start + SSIM_CHUNK_SIZE)
+                yield candidates[pairs], rows[pairs], batched_ssim(
+                    frames_gray[candidates[pairs]],
+                    frames_mean[candidates[pairs]],
+                    frames_var[candidates[pairs]],
+                    self._refs[rows[pairs]],
+                    self._refs_mean[rows[pairs]],
+                    self._refs_var[rows[pairs]],
+                )
+
+    def _iter_scores(self, frame: MatLike, prune_below: float | None = None) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """Yield `(rows, similarities)`: the SSIM scores of `frame` against the references, see `_iter_batch_scores`."""
+        for _, rows, similarities in self._iter_batch_scores([frame], prune_below):
+            yield rows, similarities
+
+    def _search(self, frames: List[MatLike], min_threshold, stop_threshold, shortlist: str | None) -> List[Tuple[int | None, float]]:
+        """Match `frames` against the references of their `shortlist`, see `get_matches` and `_search_rows`."""
+        matches: List[Tuple[int | None, float]] = [(None, 0.0)] * len(frames)
+        active = np.ones(len(frames), dtype=bool)
+        batches = self._iter_batch_scores(frames, min_threshold - PYRAMID_PRUNE_MARGIN, active, shortlist)
+        for candidates, rows, similarities in batches:
+            # Split the pairs by candidate
+            starts = np.flatnonzero(np.diff(candidates, prepend=-1))
+            for start, stop in zip(starts, np.append(starts[1:], len(candidates))):
+                candidate = candidates[start]
+                if not active[candidate]:
+                    # Stopped on a previous part of the same chunk
+                    continue
+                candidate_rows, candidate_similarities = rows[start:stop], similarities[start:stop]
+                # First reference over `stop_threshold` in search order wins
+                stop_hits = np.flatnonzero(candidate_similarities >= stop_threshold)
+                if stop_hits.size:
+                    hit = stop_hits[0]
+                    matches[candidate] = (int(self._ref_indices[candidate_rows[hit]]), float(candidate_similarities[hit]))
+                    active[candidate] = False
+                    continue
+                best = int(np.argmax(candidate_similarities))
+                similarity = float(candidate_similarities[best])
+                if similarity >= min_threshold and similarity > matches[candidate][1]:
+                    matches[candidate] = (int(self._ref_indices[candidate_rows[best]]), similarity)
+        return matches
+
+    def get_matches(self, frames: List[MatLike], min_threshold, stop_threshold) -> List[Tuple[int | None, float]]:
+        """
+        Match several detected cards at once, their comparisons with the references being scored together.
+
+        With `self.prefilter_k`, the cards are compared to the references of nearest hash first, then
+        the ones matching none of them to the `self.fallback_k` references of best correlated thumbnail.
+        Without `self.fallback_k` they are compared to all the others, as a card not enrolled always is:
+        its cost then grows with the references, even with the pyramid pruning.
+
+        Params
+            - frames: 2D Frames of the cards detected
+            - min_threshold: Sufficient threshold to interpret frame as similar card
+            - stop_threshold: Threshold to interpret frame as corresponding card
+        Returns
+            - for each frame, the index of the item in `self.ref_images` matching it, None if no image
+                satisfy the tolerance threshold, and the similarity of that item, 0 if None.
+        """
+        if not frames:
+            return []
+        matches = self._search(frames, min_threshold, stop_threshold, "hash")
+        if self.prefilter_k is None or self.prefilter_k >= len(self._refs):
+            return matches
+        # The hash of a card under another lighting or angle can be far from its reference one,
+        # the thumbnails correlation is not as sensitive but costs a product with all of them
+        unmatched = [i for i, (idx, _) in enumerate(matches) if idx is None]
+        if unmatched:
+            fallback_matches = self._search([frames[i] for i in unmatched], min_threshold, stop_threshold, "thumbnail")
+            for i, match in zip(unmatched, fallback_matches):
+                matches[i] = match
+        return matches
 
     def get_match_idx(self, frame: MatLike, min_threshold, stop_threshold) -> int | None:
         """
@@ -41,16 +437,4 @@ class ImageComparator:
             - index of the item in `self.ref_images` matching `frame`.
             - None if no image satisfy the tolerance threshold.
         """
-        frame_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        small_frame_gray = cv2.resize(frame_gray, self.compare_size)
-        best_score = (None, 0.0)
-        for i, ref_image in enumerate(self.ref_images):
-            if ref_image is None:
-                continue
-            similarity = ssim(small_frame_gray, ref_image)
-            if similarity >= stop_threshold:
-                return i
-            elif similarity >= min_threshold:
-                if similarity > best_score[1]:
-                    best_score = (i, similarity)
-        return best_score[0]
+        return self.get_matches([frame], min_threshold, stop_threshold)[0][0]
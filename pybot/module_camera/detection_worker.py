@@ -0,0 +1,188 @@
+import multiprocessing
+from multiprocessing import resource_tracker
+from multiprocessing.connection import Connection
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+from cv2.typing import MatLike
+from typing import Dict, Tuple
+
+import logging
+
+from .card_detection import CardsDetection, detect_cards
+from .card_references import CardReferences
+from .card_tracking import CardTracks
+from .match_cache import MatchCache
+from .processes import reset_signal_handlers
+
+_warning = logging.getLogger("CardDetectionWorker").warning
+"""Custom Logger warning function. Print a message only shown when DEBUG mode is activated."""
+
+DetectionKey = Tuple[float, float, str]
+"""(min_threshold, stop_threshold, method) a detection was made with."""
+
+
+def _worker_loop(conn: Connection):
+    """
+    Body of the worker process. Receive messages from `conn`:
+        - ("frame_memory", name, shape): shared memory holding the frames to scan
+        - ("references", references): `CardReferences` to build the matchers from
+        - ("changes", changes): changes of the references, see `CardReferences.changes_since`
+        - ("priorities", priorities): new priorities of the references
+        - ("detect", key): scan the shared frame and send back the `CardsDetection`
+        - ("stop",)
+    """
+    reset_signal_handlers()
+    memory, frame = None, None
+    references: CardReferences | None = None
+    tracks: Dict[DetectionKey, CardTracks] = {}
+    caches: Dict[str, MatchCache] = {}
+    while True:
+        message = conn.recv()
+        kind = message[0]
+        if kind == "stop":
+            break
+        elif kind == "frame_memory":
+            if memory is not None:
+                frame = None
+                memory.close()
+            _, name, shape = message
+            memory = SharedMemory(name=name)
+            frame = np.ndarray(shape, dtype=np.uint8, buffer=memory.buf)
+        elif kind == "references":
+            references = message[1]
+        elif kind == "changes":
+            references.apply_changes(message[1])
+        elif kind == "priorities":
+            references.set_priorities(message[1])
+        elif kind == "detect":
+            key = message[1]
+            min_threshold, stop_threshold, method = key
+            try:
+                # Built here on first use, or once the users changed
+                matcher = references.get_matcher(method)
+                detection = detect_cards(
+                    frame,
+                    matcher,
+                    min_threshold,
+                    stop_threshold,
+                    references.generation,
+                    tracks.setdefault(key, CardTracks()),
+                    caches.setdefault(method, MatchCache()),
+                )
+            except Exception as e:
+                detection = e
+            conn.send((key, detection))
+    if memory is not None:
+        frame = None
+        memory.close()
+
+
+class CardDetectionWorker:
+    """
+    Scan frames for cards in a separate process, on another core than the render loop.
+
+    The frame is handed over through shared memory. `submit` never waits: while the
+    worker is busy, new frames are ignored, and `poll` returns the most recent
+    detection completed.
+    """
+
+    def __init__(self):
+        # "fork" does not re-run the user script, unlike "spawn", as it is rarely
+        # guarded by `if __name__ == "__main__"`
+        context = multiprocessing.get_context("fork")
+        # Started before forking so both processes share it, else the worker would
+        # start its own one, unaware the shared memory is released by this process
+        resource_tracker.ensure_running()
+        self._conn, worker_conn = context.Pipe()
+        self._process = context.Process(target=_worker_loop, args=(worker_conn,), daemon=True)
+        self._process.start()
+        worker_conn.close()
+        self._memory: SharedMemory | None = None
+        self._frame: MatLike | None = None
+        self._sent_generation: int | None = None
+        """Generation of the references of the worker."""
+        self._sent_priorities: int | None = None
+        """Version of the priorities of the references of the worker."""
+        self.busy = False
+        self.detections: Dict[DetectionKey, CardsDetection] = {}
+        """Most recent detection completed for each `DetectionKey`."""
+
+    def _share_frame(self, frame: MatLike):
+        """Copy `frame` in the shared memory, (re)allocated when the frame size changes."""
+        if self._frame is None or self._frame.shape != frame.shape:
+            self._release_memory()
+            self._memory = SharedMemory(create=True, size=frame.nbytes)
+            self._frame = np.ndarray(frame.shape, dtype=np.uint8, buffer=self._memory.buf)
+            self._conn.send(("frame_memory", self._memory.name, frame.shape))
+        np.copyto(self._frame, frame)
+
+    def _send_references(self, references: CardReferences):
+        """Bring the references of the worker up to date with `references`, from their changes if possible."""
+        if self._sent_generation != references.generation:
+            changes = references.changes_since(self._sent_generation)
+            if changes is None:
+                self._conn.send(("references", references))
+                self._sent_priorities = references.priorities_version
+            else:
+                self._conn.send(("changes", changes))
+            self._sent_generation = references.generation
+            # Indices found with the previous references may refer to other users
+            self.detections = {}
+        if self._sent_priorities != references.priorities_version:
+            self._conn.send(("priorities", references.priorities))
+            self._sent_priorities = references.priorities_version
+
+    def submit(self, frame: MatLike, min_threshold, stop_threshold, method: str, references: CardReferences) -> bool:
+        """
+        Send `frame` to be scanned if the worker is idle.
+
+        The worker builds its own matchers from a copy of `references`, updated from their changes
+        since the last frame: the matchers are never sent, their pickling would stall the render loop.
+
+        Params
+            - frame: 2D RGB Frame in pygame layout (width, height, 3)
+            - min_threshold, stop_threshold, method: see `UserCardsTracker.detect_cards`
+            - references: the users cards to match the cards against
+        Returns
+            - True if the frame was submitted, False if the worker was busy.
+        """
+        self.poll()
+        if self.busy:
+            return False
+        self._send_references(references)
+        self._share_frame(frame)
+        self._conn.send(("detect", (min_threshold, stop_threshold, method)))
+        self.busy = True
+        return True
+
+    def poll(self, min_threshold=None, stop_threshold=None, method: str = None) -> CardsDetection | None:
+        """
+        Collect the detections completed, without waiting.
+        Return the most recent one made with the given parameters, None if there is none yet.
+        """
+        while self._conn.poll():
+            key, detection = self._conn.recv()
+            self.busy = False
+            if isinstance(detection, Exception):
+                _warning(f"Card detection failed: {detection}")
+                continue
+            self.detections[key] = detection
+        return self.detections.get((min_threshold, stop_threshold, method))
+
+    def _release_memory(self):
+        if self._memory is not None:
+            # The array must not reference the buffer anymore to close it
+            self._frame = None
+            self._memory.close()
+            self._memory.unlink()
+            self._memory = None
+
+    def stop(self):
+        try:
+            self._conn.send(("stop",))
+        except (BrokenPipeError, OSError):
+            pass
+        self._process.join(timeout=1)
+        if self._process.is_alive():
+            self._process.terminate()
+        self._release_memory()
@@ -0,0 +1,134 @@
+import threading
+import time
+from cv2.typing import MatLike
+from typing import List, NamedTuple
+
+from .frame_sources import FrameSource
+
+MEASURE_SMOOTHING = 0.1
+"""Weight of the last frame in the moving averages of the capture frame rate and latency."""
+
+
+def _smooth(average: float | None, value: float) -> float:
+    if average is None:
+        return value
+    return average + MEASURE_SMOOTHING * (value - average)
+
+
+class Frame(NamedTuple):
+    seq: int
+    """Number of the frame since the capture started, starting at 1."""
+    timestamp: float
+    """`time.monotonic()` when the frame was read."""
+    image: MatLike
+
+
+class FrameGrabber:
+    """
+    Read the frames of a `FrameSource` in a background thread, so the
+    render loop never waits for the camera, and keep the most recent ones in a ring buffer.
+
+    The capture thread only fills a slot then publishes its sequence number, and a
+    slot is not written again before `buffer_size - 1` newer frames: readers
+    get the latest frame without taking any lock.
+
+    A source that is not `realtime` is read in lockstep with `latest`: the next frame
+    is only read once the previous one was returned, so no frame is dropped.
+
+    `latest` consumes the frames and is meant for the render loop only, other threads,
+    e.g. taking photos, read them with `peek` or `wait_newer`.
+    """
+
+    def __init__(self, source: FrameSource, buffer_size: int = 4):
+        self.source = source
+        self._slots: List[Frame | None] = [None] * buffer_size
+        self._last_seq = 0
+        """Sequence number of the most recent frame published."""
+        self._consumed_seq = 0
+        """Sequence number of the most recent frame returned by `latest`."""
+        self.dropped_frames = 0
+        """Number of frames captured but never returned by `latest`."""
+        self._frame_interval: float | None = None
+        self.latency: float | None = None
+        """Moving average of the age, in seconds, of the frames when `latest` first returns them."""
+        self._consumed = threading.Event()
+        """Set when the last frame published was returned by `latest`, in lockstep mode."""
+        self._published = threading.Condition()
+        """Notified each time a frame is published, and when the capture ends."""
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while self._running and not self.source.finished:
+            ret, image = self.source.read()
+            if not ret:
+                # Camera unplugged or not ready yet, avoid a busy loop
+                time.sleep(0.01)
+                continue
+            seq = self._last_seq + 1
+            timestamp = time.monotonic()
+            if seq > 1:
+                interval = timestamp - self._slots[self._last_seq % len(self._slots)].timestamp
+                self._frame_interval = _smooth(self._frame_interval, interval)
+            self._slots[seq % len(self._slots)] = Frame(seq, timestamp, image)
+            self._last_seq = seq
+            with self._published:
+                self._published.notify_all()
+            if not self.source.realtime:
+                while self._running and not self._consumed.wait(timeout=0.1):
+                    pass
+                self._consumed.clear()
+        with self._published:
+            self._published.notify_all()
+
+    @property
+    def captured_frames(self) -> int:
+        return self._last_seq
+
+    @property
+    def fps(self) -> float | None:
+        """Measured capture frame rate, None before 2 frames are captured."""
+        if not self._frame_interval:
+            return None
+        return 1 / self._frame_interval
+
+    def latest(self) -> Frame | None:
+        """Return the most recent frame without waiting, None if no frame was captured yet."""
+        seq = self._last_seq
+        if seq == 0:
+            return None
+        frame = self._slots[seq % len(self._slots)]
+        if frame.seq > self._consumed_seq:
+            self.dropped_frames += frame.seq - self._consumed_seq - 1
+            self._consumed_seq = frame.seq
+            self.latency = _smooth(self.latency, time.monotonic() - frame.timestamp)
+            self._consumed.set()
+        return frame
+
+    def peek(self) -> Frame | None:
+        """Return the most recent frame without waiting nor consuming it, see `latest`. None if no frame was captured yet."""
+        seq = self._last_seq
+        if seq == 0:
+            return None
+        return self._slots[seq % len(self._slots)]
+
+    def wait_newer(self, seq: int, timeout: float | None = None) -> Frame | None:
+        """
+        Wait for a frame more recent than the frame `seq` and return it without consuming it, see `peek`.
+        None if none was captured within `timeout` seconds or the capture ended.
+        """
+        with self._published:
+            self._published.wait_for(
+                lambda: self._last_seq > seq or not self._running or not self._thread.is_alive(), timeout
+            )
+        frame = self.peek()
+        if frame is None or frame.seq <= seq:
+            return None
+        return frame
+
+    def stop(self):
+        self._running = False
+        with self._published:
+            self._published.notify_all()
+        self._thread.join(timeout=1)
@@ -0,0 +1,152 @@
+import os
+import time
+import cv2
+from cv2.typing import MatLike
+from typing import List, Tuple
+
+from .camera_settings import CameraSettings, negotiate_settings, read_settings
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+"""Files read by `ImageDirectorySource`."""
+
+
+class FrameSource:
+    """
+    Where the camera frames come from, read by the `FrameGrabber` thread.
+
+    A recorded source is either paced in real time, like a live camera, or read
+    as fast as possible: then the grabber hands over every frame exactly once,
+    so runs on the same recording are comparable.
+    """
+
+    realtime = True
+    """Deliver the frames at the source frame rate, else as fast as they are consumed."""
+    finished = False
+    """True once a recording has no more frames."""
+    settings = CameraSettings()
+    """Settings of the frames delivered."""
+
+    def read(self) -> Tuple[bool, MatLike | None]:
+        """Return (True, BGR frame), or (False, None) if no frame is available, as `cv2.VideoCapture.read`."""
+        raise NotImplementedError
+
+    def isOpened(self) -> bool:
+        """Whether frames can be read, as `cv2.VideoCapture.isOpened`."""
+        return True
+
+    def release(self):
+        pass
+
+
+class DeviceSource(FrameSource):
+    """Live camera device."""
+
+    def __init__(self, index: int = 0, settings: CameraSettings | None = None):
+        self.capture = cv2.VideoCapture(index)
+        self.requested_settings = settings or CameraSettings()
+        self.settings = negotiate_settings(self.capture, self.requested_settings)
+
+    def read(self) -> Tuple[bool, MatLike | None]:
+        return self.capture.read()
+
+    def isOpened(self) -> bool:
+        return self.capture.isOpened()
+
+    def release(self):
+        self.capture.release()
+
+
+class _RecordedSource(FrameSource):
+    """Replay recorded frames at `fps` or as fast as possible, optionally in a loop."""
+
+    def __init__(self, fps: float, realtime: bool, loop: bool):
+        self.realtime = realtime
+        self.loop = loop
+        self._interval = 1 / fps if fps > 0 else 0.0
+        self._next_time = None
+
+    def _read_next(self) -> Tuple[bool, MatLike | None]:
+        raise NotImplementedError
+
+    def _rewind(self):
+        raise NotImplementedError
+
+    def read(self) -> Tuple[bool, MatLike | None]:
+        if self.finished:
+            return False, None
+        ret, image = self._read_next()
+        if not ret and self.loop:
+            self._rewind()
+            ret, image = self._read_next()
+        if not ret:
+            self.finished = True
+            return False, None
+        if self.realtime:
+            now = time.monotonic()
+            if self._next_time is None or self._next_time < now - self._interval:
+                # First frame, or the reader fell behind: restart the clock
+                self._next_time = now
+            time.sleep(max(0.0, self._next_time - now))
+            self._next_time += self._interval
+        return True, image
+
+
+class VideoFileSource(_RecordedSource):
+    """Frames of a video file."""
+
+    def __init__(self, path: str, realtime: bool = True, loop: bool = False):
+        self.capture = cv2.VideoCapture(path)
+        if not self.capture.isOpened():
+            raise FileNotFoundError(f"Video {path} could not be opened.")
+        self.settings = read_settings(self.capture)
+        super().__init__(self.settings.fps or 30.0, realtime, loop)
+
+    def _read_next(self) -> Tuple[bool, MatLike | None]:
+        return self.capture.read()
+
+    def _rewind(self):
+        self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+    def release(self):
+        self.capture.release()
+
+
+class ImageDirectorySource(_RecordedSource):
+    """Images of a directory, in file name order."""
+
+    def __init__(self, directory: str, fps: float = 30.0, realtime: bool = True, loop: bool = False):
+        self.paths: List[str] = sorted(
+            os.path.join(directory, name)
+            for name in os.listdir(directory)
+            if name.lower().endswith(IMAGE_EXTENSIONS)
+        )
+        if not self.paths:
+            raise FileNotFoundError(f"No image in {directory}.")
+        self._position = 0
+        first = cv2.imread(self.paths[0])
+        resolution = None if first is None else (first.shape[1], first.shape[0])
+        self.settings = CameraSettings(resolution=resolution, fps=fps)
+        super().__init__(fps, realtime, loop)
+
+    def _read_next(self) -> Tuple[bool, MatLike | None]:
+        while self._position < len(self.paths):
+            image = cv2.imread(self.paths[self._position])
+            self._position += 1
+            if image is not None:
+                return True, image
+        return False, None
+
+    def _rewind(self):
+        self._position = 0
+
+
+def open_frame_source(source: int | str = 0, settings: CameraSettings | None = None, realtime: bool = True, loop: bool = False) -> FrameSource:
+    """
+    Open a camera device from its index, a directory of images or a video file from its path.
+    `settings` only apply to devices, `realtime` and `loop` to recordings.
+    """
+    if isinstance(source, int):
+        return DeviceSource(source, settings)
+    if os.path.isdir(source):
+        return ImageDirectorySource(source, realtime=realtime, loop=loop)
+    return VideoFileSource(source, realtime=realtime, loop=loop)
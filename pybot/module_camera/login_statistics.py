@@ -0,0 +1,66 @@
+import json
+import time
+from typing import Dict, List
+
+import logging
+
+from .atomic_file import atomic_write
+
+_warning = logging.getLogger("LoginStatistics").warning
+"""Custom Logger warning function. Print a message only shown when DEBUG mode is activated."""
+
+LOGIN_HALF_LIFE = 7 * 24 * 3600
+"""Seconds after which a login counts half as much in the score of a user."""
+
+
+class LoginStatistics:
+    """
+    Score of each user from its past logins, saved in a JSON file to survive restarts.
+
+    Each login adds 1 to the score of the user and the score halves every `half_life`
+    seconds, so users logging in often and recently score the highest.
+    """
+
+    def __init__(self, path: str, half_life: float = LOGIN_HALF_LIFE):
+        self.path = path
+        self.half_life = half_life
+        self._entries: Dict[int, List[float]] = {}
+        """[score, time of the score] of each user id."""
+        try:
+            with open(path) as f:
+                self._entries = {int(user_id): entry for user_id, entry in json.load(f).items()}
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, AttributeError) as e:
+            _warning(f"Login statistics at {path} could not be read: {e}")
+
+    def score(self, user_id: int, now: float | None = None) -> float:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return 0.0
+        if now is None:
+            now = time.time()
+        score, last = entry
+        return score * 0.5 ** (max(0.0, now - last) / self.half_life)
+
+    def scores(self, user_ids: List[int]) -> List[float]:
+        """Current score of each user, 0 for the ones that never logged in."""
+        now = time.time()
+        return [self.score(user_id, now) for user_id in user_ids]
+
+    def record(self, user_id: int):
+        """Count a login of `user_id` and save the statistics."""
+        now = time.time()
+        self._entries[user_id] = [self.score(user_id, now) + 1, now]
+        self.save()
+
+    def remove(self, user_id: int):
+        if self._entries.pop(user_id, None) is not None:
+            self.save()
+
+    def save(self):
+        try:
+            with atomic_write(self.path) as f:
+                json.dump(self._entries, f)
+        except OSError as e:
+            _warning(f"Login statistics could not be written at {self.path}: {e}")
@@ -0,0 +1,164 @@
+import numpy as np
+from typing import List, Tuple
+
+from .perceptual_hash import _POPCOUNT
+
+LSH_TABLE_COUNT = 8
+"""Number of hash tables: a descriptor is a neighbour candidate if it shares its bucket in one of them."""
+
+LSH_MIN_KEY_BITS = 12
+"""
+Fewest descriptor bits hashed per table. The index hashes as many bits as needed for its
+buckets to hold about one descriptor each, so the cost of a query does not grow with it.
+Each more bit also makes a near descriptor less likely to share a bucket.
+"""
+
+LSH_MAX_BUCKET = 32
+"""Buckets holding more descriptors are skipped: such common descriptors do not tell the cards apart."""
+
+LSH_REBUILD_RATIO = 0.1
+"""Share of the indexed descriptors added or removed since the last build after which the index is built again."""
+
+_HASH_CHUNK = 65536
+"""Number of descriptors whose keys are computed at once, bounds the unpacked bits memory."""
+
+
+class LshIndex:
+    """
+    Locality sensitive hashing index of binary descriptors, e.g. ORB ones, each labelled with the card it comes from.
+
+    The descriptors of the last build are found in constant time from a directory of the buckets of each table.
+    The descriptors added since are kept sorted by key apart, and the removed ones are only marked, until they
+    amount to `LSH_REBUILD_RATIO` of the index: adding or removing a card costs about its own descriptors.
+    """
+
+    def __init__(self, descriptor_bytes: int = 32, table_count: int = LSH_TABLE_COUNT, min_key_bits: int = LSH_MIN_KEY_BITS, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        self._bit_orders = np.array([rng.permutation(8 * descriptor_bytes) for _ in range(table_count)])
+        """Descriptor bits of each table, the first ones are hashed."""
+        self.min_key_bits = min_key_bits
+        self.descriptors = np.empty((0, descriptor_bytes), np.uint8)
+        self.labels = np.empty(0, np.int32)
+        """Label of each of `self.descriptors`, -1 once removed."""
+        self._removed = 0
+        self._build()
+
+    def __len__(self):
+        """Number of indexed descriptors, not counting the removed ones."""
+        return len(self.descriptors) - self._removed
+
+    def _hash(self, descriptors: np.ndarray) -> np.ndarray:
+        """Keys of `descriptors` in each table, shape (table_count, len(descriptors))."""
+        keys = np.empty((len(self._key_bits), len(descriptors)), np.int32)
+        for start in range(0, len(descriptors), _HASH_CHUNK):
+            bits = np.unpackbits(descriptors[start : start + _HASH_CHUNK], axis=1)
+            for table, key_bits in enumerate(self._key_bits):
+                keys[table, start : start + _HASH_CHUNK] = bits[:, key_bits].astype(np.int32) @ self._key_weights
+        return keys
+
+    def _build(self):
+        """Drop the removed descriptors and build the buckets directory of every descriptor."""
+        if self._removed:
+            kept = self.labels >= 0
+            self.descriptors, self.labels = self.descriptors[kept], self.labels[kept]
+            self._removed = 0
+        key_bits = max(self.min_key_bits, int(np.ceil(np.log2(max(len(self.descriptors), 1)))))
+        self._key_bits = self._bit_orders[:, :key_bits]
+        """Bits of the descriptors hashed by each table, shape (table_count, key_bits)."""
+        self._key_weights = (1 << np.arange(key_bits)).astype(np.int32)
+        keys = self._hash(self.descriptors)
+        bucket_count = 1 << key_bits
+        self._offsets = np.zeros((len(self._key_bits), bucket_count + 1), np.int32)
+        """Start of each bucket in `self._rows`, per table."""
+        self._rows = np.empty((len(self._key_bits), len(self.descriptors)), np.int32)
+        """Rows of `self.descriptors` of each table, grouped by bucket."""
+        for table in range(len(self._key_bits)):
+            np.cumsum(np.bincount(keys[table], minlength=bucket_count), out=self._offsets[table, 1:])
+            self._rows[table] = np.argsort(keys[table], kind="stable")
+        self._built = len(self.descriptors)
+        """Number of descriptors in the directory, the next ones were added since."""
+        self._added_keys = np.empty((len(self._key_bits), 0), np.int32)
+        """Sorted keys of each table of the descriptors added since the build."""
+        self._added_rows = np.empty((len(self._key_bits), 0), np.int32)
+        """Row in `self.descriptors` of each of `self._added_keys`."""
+
+    def _needs_build(self) -> bool:
+        changed = len(self.descriptors) - self._built + self._removed
+        return changed > LSH_REBUILD_RATIO * len(self.descriptors)
+
+    def add(self, descriptors: np.ndarray, labels: np.ndarray):
+        """Index `descriptors`, shape (N, descriptor_bytes), with the `labels` of their cards."""
+        rows = np.arange(len(self.descriptors), len(self.descriptors) + len(descriptors), dtype=np.int32)
+        self.descriptors = np.concatenate([self.descriptors, descriptors])
+        self.labels = np.concatenate([self.labels, np.asarray(labels, np.int32)])
+        if self._needs_build():
+            self._build()
+            return
+        keys = self._hash(descriptors)
+        added_keys, added_rows = [], []
+        for table in range(len(self._key_bits)):
+            order = np.argsort(keys[table], kind="stable")
+            positions = np.searchsorted(self._added_keys[table], keys[table][order], side="right")
+            added_keys.append(np.insert(self._added_keys[table], positions, keys[table][order]))
+            added_rows.append(np.insert(self._added_rows[table], positions, rows[order]))
+        self._added_keys, self._added_rows = np.array(added_keys), np.array(added_rows)
+
+    def remove(self, label: int):
+        """Remove the descriptors of the card `label`."""
+        removed = self.labels == label
+        self.labels[removed] = -1
+        self._removed += int(np.count_nonzero(removed))
+        if self._needs_build():
+            self._build()
+
+    def shift_labels(self, label: int):
+        """Decrement the labels greater than `label`, e.g. once the card `label` is removed."""
+        self.labels[self.labels > label] -= 1
+
+    @staticmethod
+    def _bucket_rows(starts: np.ndarray, counts: np.ndarray, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the query index and the row of each descriptor of the buckets `rows[start:start + count]` of the queries."""
+        counts = np.where(counts > LSH_MAX_BUCKET, 0, counts)
+        query_idx = np.repeat(np.arange(len(starts), dtype=np.int64), counts)
+        # Position of each descriptor in the bucket of its query
+        offsets = np.arange(len(query_idx)) - np.repeat(np.cumsum(counts) - counts, counts)
+        return query_idx, rows[np.repeat(starts, counts) + offsets]
+
+    def knn2(self, queries: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Find the 2 nearest indexed descriptors, in Hamming distance, of each query descriptor
+        among the ones sharing one of its buckets.
+
+        Returns
+            - the index of each query descriptor with at least one neighbour
+            - the row of its nearest neighbour and the distance to it
+            - the row of its second nearest neighbour and the distance to it, -1 if it has only one
+        """
+        query_bits = np.unpackbits(queries, axis=1)
+        # A pair (query, row) is encoded as query * len(self.descriptors) + row
+        size = max(len(self.descriptors), 1)
+        pairs: List[np.ndarray] = []
+        for table, key_bits in enumerate(self._key_bits):
+            keys = query_bits[:, key_bits].astype(np.int32) @ self._key_weights
+            starts = self._offsets[table, keys]
+            query_idx, rows = self._bucket_rows(starts, self._offsets[table, keys + 1] - starts, self._rows[table])
+            pairs.append(query_idx * size + rows)
+            if self._added_keys.shape[1]:
+                starts = np.searchsorted(self._added_keys[table], keys, side="left")
+                counts = np.searchsorted(self._added_keys[table], keys, side="right") - starts
+                query_idx, rows = self._bucket_rows(starts, counts, self._added_rows[table])
+                pairs.append(query_idx * size + rows)
+        # The same neighbour may be found by several tables
+        query_idx, rows = np.divmod(np.unique(np.concatenate(pairs)), size)
+        if self._removed:
+            kept = self.labels[rows] >= 0
+            query_idx, rows = query_idx[kept], rows[kept]
+        distances = _POPCOUNT[np.bitwise_xor(queries[query_idx], self.descriptors[rows])].sum(axis=1, dtype=np.intp)
+        order = np.lexsort((distances, query_idx))
+        query_idx, rows, distances = query_idx[order], rows[order], distances[order]
+        firsts = np.flatnonzero(np.diff(query_idx, prepend=-1))
+        seconds = np.minimum(firsts + 1, len(rows) - 1)
+        has_second = (firsts + 1 < len(rows)) & (query_idx[seconds] == query_idx[firsts])
+        second_rows = np.where(has_second, rows[seconds], -1)
+        second_distances = np.where(has_second, distances[seconds], -1)
+        return query_idx[firsts], rows[firsts], distances[firsts], second_rows, second_distances
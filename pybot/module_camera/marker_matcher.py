@@ -0,0 +1,111 @@
+import cv2
+import numpy as np
+from cv2.typing import MatLike
+from typing import Dict, List, Tuple
+
+MARKER_DICTIONARY = cv2.aruco.DICT_4X4_1000
+"""ArUco dictionary of the markers printed on the cards. Its large cells stay readable on a small card."""
+
+MARKER_COUNT = 1000
+"""Number of markers of `MARKER_DICTIONARY`: at most as many users can have one, see `UserDAO.allocate_marker`."""
+
+MARKER_SCORE = 1.0
+"""Score of a card identified by its marker, the highest score of the other matchers."""
+
+
+def marker_image(marker_id: int, size: int = 200) -> MatLike:
+    """
+    Grayscale image of the marker `marker_id`, `size` pixels wide with its white margin, to print on a card.
+    Raise ValueError if the id has no marker.
+    """
+    if not 0 <= marker_id < MARKER_COUNT:
+        raise ValueError(f"No marker for id {marker_id}, the markers ids go from 0 to {MARKER_COUNT - 1}")
+    margin = size // 8
+    dictionary = cv2.aruco.getPredefinedDictionary(MARKER_DICTIONARY)
+    marker = cv2.aruco.generateImageMarker(dictionary, marker_id, size - 2 * margin)
+    # The detector needs a light quiet zone around the marker black border
+    return cv2.copyMakeBorder(marker, margin, margin, margin, margin, cv2.BORDER_CONSTANT, value=255)
+
+
+class MarkerMatcher:
+    """
+    Identify the cards carrying a printed ArUco marker by the marker id of their user,
+    whatever the number of users, and the other cards with the `fallback` matcher.
+    """
+
+    def __init__(self, marker_ids: List[int | None], fallback):
+        """
+        Params
+            - marker_ids: marker id of the user of each reference of `fallback`, in its order, None if it has none
+            - fallback: matcher of the cards without a known marker, e.g. an `ImageComparator`
+        """
+        self.fallback = fallback
+        self._indices: Dict[int, int] = {
+            marker_id: idx for idx, marker_id in enumerate(marker_ids) if marker_id is not None
+        }
+        """Reference index of each marker id."""
+        self._detector = self._create_detector()
+
+    @staticmethod
+    def _create_detector() -> cv2.aruco.ArucoDetector:
+        return cv2.aruco.ArucoDetector(
+            cv2.aruco.getPredefinedDictionary(MARKER_DICTIONARY),
+            cv2.aruco.DetectorParameters(),
+        )
+
+    def __getstate__(self):
+        # The cv2 detector can not be pickled, it is created again
+        state = self.__dict__.copy()
+        del state["_detector"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._detector = self._create_detector()
+
+    def marker_ids(self, frame: MatLike) -> List[int]:
+        """Ids of the markers found in `frame`."""
+        if frame.ndim == 3:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        _, ids, _ = self._detector.detectMarkers(frame)
+        return [] if ids is None else [int(i) for i in np.ravel(ids)]
+
+    def _marker_match(self, frame: MatLike) -> int | None:
+        """Index of the reference whose user has a marker of `frame`, None if there is none."""
+        for marker_id in self.marker_ids(frame):
+            idx = self._indices.get(marker_id)
+            if idx is not None:
+                return idx
+        return None
+
+    def get_matches(self, frames: List[MatLike], min_threshold, stop_threshold) -> List[Tuple[int | None, float]]:
+        """
+        Match several detected cards: by their marker, with `MARKER_SCORE`, else all the
+        cards without a known marker at once with the `fallback` matcher.
+        """
+        matches: List[Tuple[int | None, float] | None] = [None] * len(frames)
+        unmarked = []
+        for i, frame in enumerate(frames):
+            idx = self._marker_match(frame)
+            if idx is None:
+                unmarked.append(i)
+            else:
+                matches[i] = (idx, MARKER_SCORE)
+        fallback_matches = self.fallback.get_matches([frames[i] for i in unmarked], min_threshold, stop_threshold)
+        for i, match in zip(unmarked, fallback_matches):
+            matches[i] = match
+        return matches
+
+    def get_match_idx(self, frame: MatLike, min_threshold, stop_threshold) -> int | None:
+        """
+        Params
+            - frame: 2D Frame of the card detected
+            - min_threshold, stop_threshold: thresholds of the `fallback` matcher
+        Returns
+            - index of the reference whose user has a marker of `frame`,
+                else the `fallback` match.
+        """
+        idx = self._marker_match(frame)
+        if idx is not None:
+            return idx
+        return self.fallback.get_match_idx(frame, min_threshold, stop_threshold)
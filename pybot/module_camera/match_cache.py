@@ -0,0 +1,67 @@
+import cv2
+from collections import OrderedDict
+from cv2.typing import MatLike
+from typing import Hashable, Tuple
+
+Match = Tuple[int | None, float]
+"""Reference index matched by a card, None if none, and its score."""
+
+
+def candidate_fingerprint(card_img: MatLike, size=(8, 8), levels: int = 8) -> bytes:
+    """
+    Quantized fingerprint of a detected card image: grayscale thumbnail with `levels` gray levels.
+    Consecutive frames of the same card usually give the same fingerprint despite the camera noise.
+    """
+    small = cv2.resize(card_img, size, interpolation=cv2.INTER_AREA)
+    if small.ndim == 3:
+        small = cv2.cvtColor(small, cv2.COLOR_RGB2GRAY)
+    return (small // (256 // levels)).tobytes()
+
+
+class MatchCache:
+    """
+    Least recently used cache of match results, keyed by `candidate_fingerprint`.
+    The results of older tracker generations are evicted, as they may refer to other users.
+    """
+
+    def __init__(self, max_size: int = 256):
+        self.max_size = max_size
+        self._entries: OrderedDict[Hashable, Match] = OrderedDict()
+        self.generation = None
+        """Tracker generation of the cached results."""
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        """Number of results dropped because the cache was full or their generation ended."""
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _set_generation(self, generation: int):
+        if generation != self.generation:
+            self.evictions += len(self._entries)
+            self._entries.clear()
+            self.generation = generation
+
+    def get(self, key: Hashable, generation: int) -> Tuple[bool, Match | None]:
+        """Return (True, cached result) if `key` was matched in `generation`, else (False, None)."""
+        self._set_generation(generation)
+        if key not in self._entries:
+            self.misses += 1
+            return False, None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return True, self._entries[key]
+
+    def put(self, key: Hashable, generation: int, match: Match):
+        self._set_generation(generation)
+        self._entries[key] = match
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
@@ -0,0 +1,64 @@
+import cv2
+import numpy as np
+from cv2.typing import MatLike
+from typing import Dict, Hashable
+
+MOTION_PERCENTILE = 95
+"""
+Percentile of the thumbnails pixels differences measuring the motion: a card changing
+in a static scene only covers a part of the frame, and would barely move the mean.
+"""
+
+
+class MotionGate:
+    """
+    Tell whether the scene changed since a detection was made, from the
+    differences between tiny grayscale thumbnails of the frames.
+
+    Each detection kind (`key`) has its own reference thumbnail: the one of the
+    frame its last detection was made on.
+    """
+
+    def __init__(self, threshold: float = 4.0, size=(32, 24)):
+        """
+        Params
+            - threshold: absolute difference, between 0 and 255, of the `MOTION_PERCENTILE`
+                percentile of the pixels over which the scene moved
+            - size: size of the compared thumbnails
+        """
+        self.threshold = threshold
+        self.size = size
+        self._references: Dict[Hashable, MatLike] = {}
+        self.hits = 0
+        """Number of detections skipped because the scene was static."""
+        self.misses = 0
+        """Number of detections run because the scene moved or had no reference."""
+
+    def thumbnail(self, frame: MatLike) -> MatLike:
+        small = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_RGB2GRAY)
+
+    def motion(self, thumbnail: MatLike, key: Hashable) -> float:
+        """Difference between `thumbnail` and the reference of `key`, inf if it has none."""
+        reference = self._references.get(key)
+        if reference is None:
+            return np.inf
+        return float(np.percentile(cv2.absdiff(thumbnail, reference), MOTION_PERCENTILE))
+
+    def should_scan(self, thumbnail: MatLike, key: Hashable) -> bool:
+        """Whether the frame of `thumbnail` moved from the reference of `key`. Counts the hits and misses."""
+        if self.motion(thumbnail, key) <= self.threshold:
+            self.hits += 1
+            return False
+        self.misses += 1
+        return True
+
+    def set_reference(self, thumbnail: MatLike | None, key: Hashable):
+        if thumbnail is None:
+            self.reset(key)
+        else:
+            self._references[key] = thumbnail
+
+    def reset(self, key: Hashable):
+        """Forget the reference of `key`, its next check will always scan."""
+        self._references.pop(key, None)
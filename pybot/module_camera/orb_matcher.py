@@ -0,0 +1,163 @@
+import cv2
+import numpy as np
+from cv2.typing import MatLike
+from typing import List, Tuple
+
+from .lsh_index import LshIndex
+
+import logging
+
+_warning = logging.getLogger("OrbMatcher").warning
+"""Custom Logger warning function. Print a message only shown when DEBUG mode is activated."""
+
+RATIO_TEST = 0.75
+"""Lowe's ratio: a descriptor votes only if its nearest neighbour is clearly better than the second one."""
+
+MIN_VOTES = 10
+"""Minimum number of votes for a detected card to be identified at all."""
+
+MIN_REFERENCE_VOTES = 2
+"""
+Fewer votes for a reference are not counted. The descriptors whose counterpart is not found
+vote for random references, one vote each, more and more spread as the references grow.
+"""
+
+MAX_VOTE_DISTANCE = 40
+"""
+Hamming distance, out of 256 bits, under which a descriptor votes for its nearest neighbour.
+The index only searches the buckets of a descriptor, so a descriptor of the card may not find its
+counterpart: its nearest neighbour is then a far descriptor of any card, which should not vote.
+"""
+
+REFERENCE_FEATURES = 150
+"""
+Number of descriptors, the strongest ones, indexed per reference card. Bounds the index
+size, and the crowding of its buckets, to a fixed amount per card.
+"""
+
+
+class OrbCardMatcher:
+    """
+    Identify cards by ORB keypoint descriptors voting for the reference card they
+    were matched to. Unlike SSIM, the descriptors do not depend on the card orientation.
+
+    The score of a reference is its share of the votes, so `min_threshold` and
+    `stop_threshold` keep their meaning of a ratio between 0 and 1.
+    """
+
+    def __init__(self, paths: List[str], card_size=(200, 200), n_features=500, reference_features=REFERENCE_FEATURES):
+        self.card_size = card_size
+        self.orb = cv2.ORB_create(nfeatures=n_features)
+        """Describes the detected cards."""
+        self.reference_orb = cv2.ORB_create(nfeatures=reference_features)
+        """Describes the reference cards."""
+        self._reference_count = len(paths)
+        self._index = LshIndex()
+        """Descriptors of the references, labelled with their reference index."""
+        descriptors = [self._load_descriptors(path) for path in paths]
+        labelled = [(desc, idx) for idx, desc in enumerate(descriptors) if desc is not None]
+        if labelled:
+            self._index.add(
+                np.concatenate([desc for desc, _ in labelled]),
+                np.concatenate([np.full(len(desc), idx) for desc, idx in labelled]),
+            )
+
+    def __getstate__(self):
+        # cv2 ORB objects can not be pickled, they are created again
+        state = self.__dict__.copy()
+        del state["orb"], state["reference_orb"]
+        state["n_features"] = self.orb.getMaxFeatures()
+        state["reference_features"] = self.reference_orb.getMaxFeatures()
+        return state
+
+    def __setstate__(self, state):
+        self.orb = cv2.ORB_create(nfeatures=state.pop("n_features"))
+        self.reference_orb = cv2.ORB_create(nfeatures=state.pop("reference_features"))
+        self.__dict__.update(state)
+
+    def _add_descriptors(self, idx: int, descriptors: MatLike | None):
+        if descriptors is not None:
+            self._index.add(descriptors, np.full(len(descriptors), idx))
+
+    def add_reference(self, path: str):
+        """Append the card picture at `path` to the references."""
+        self._add_descriptors(self._reference_count, self._load_descriptors(path))
+        self._reference_count += 1
+
+    def remove_reference(self, idx: int):
+        """Remove the reference at index `idx`. The following references indices are shifted down."""
+        self._index.remove(idx)
+        self._index.shift_labels(idx)
+        self._reference_count -= 1
+
+    def update_reference(self, idx: int, path: str):
+        """Replace the reference at index `idx` by the card picture at `path`."""
+        self._index.remove(idx)
+        self._add_descriptors(idx, self._load_descriptors(path))
+
+    def _describe(self, img_gray: MatLike, orb: cv2.ORB) -> MatLike | None:
+        """Compute the ORB descriptors of a grayscale card with `orb`, None if no keypoint is found."""
+        img_gray = cv2.resize(img_gray, self.card_size)
+        _, descriptors = orb.detectAndCompute(img_gray, None)
+        return descriptors
+
+    def _load_descriptors(self, path: str) -> MatLike | None:
+        img = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        if img is None:
+            _warning(f"Image at path {path} failed to load.")
+            return None
+        descriptors = self._describe(img, self.reference_orb)
+        if descriptors is None:
+            _warning(f"No keypoint found in image at path {path}.")
+        return descriptors
+
+    def _vote(self, descriptors: MatLike) -> Tuple[np.ndarray, int]:
+        """Return the votes of `descriptors` for each reference and the number of votes."""
+        _, nearest, distances, second, second_distances = self._index.knn2(descriptors)
+        labels = self._index.labels[nearest]
+        # The ratio test is only meaningful between 2 different cards
+        ambiguous = (
+            (second >= 0)
+            & (self._index.labels[second] != labels)
+            & (distances >= RATIO_TEST * second_distances)
+        )
+        voting = ~ambiguous & (distances < MAX_VOTE_DISTANCE)
+        votes = np.bincount(labels[voting], minlength=self._reference_count)
+        votes[votes < MIN_REFERENCE_VOTES] = 0
+        return votes, int(votes.sum())
+
+    def _match(self, frame: MatLike, min_threshold, stop_threshold) -> Tuple[int | None, float]:
+        """Return the reference index matching `frame`, None if none, and its share of the votes, 0 if None."""
+        if not len(self._index):
+            return None, 0.0
+        descriptors = self._describe(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), self.orb)
+        if descriptors is None:
+            return None, 0.0
+        votes, total = self._vote(descriptors)
+        if total < MIN_VOTES:
+            return None, 0.0
+        scores = votes / total
+        stop_hits = np.flatnonzero(scores >= stop_threshold)
+        if stop_hits.size:
+            return int(stop_hits[0]), float(scores[stop_hits[0]])
+        best = int(np.argmax(scores))
+        if scores[best] >= min_threshold:
+            return best, float(scores[best])
+        return None, 0.0
+
+    def get_matches(self, frames: List[MatLike], min_threshold, stop_threshold) -> List[Tuple[int | None, float]]:
+        """Match several detected cards: the reference index and share of the votes of each one, see `get_match_idx`."""
+        # Each card is voted for by its own descriptors, the index is queried card by card
+        return [self._match(frame, min_threshold, stop_threshold) for frame in frames]
+
+    def get_match_idx(self, frame: MatLike, min_threshold, stop_threshold) -> int | None:
+        """
+        Params
+            - frame: 2D Frame of the card detected
+            - min_threshold: Sufficient share of the votes to interpret frame as similar card
+            - stop_threshold: Share of the votes to interpret frame as corresponding card
+        Returns
+            - index of the reference card matching `frame`.
+            - None if no card satisfy the tolerance threshold.
+        """
+        return self._match(frame, min_threshold, stop_threshold)[0]
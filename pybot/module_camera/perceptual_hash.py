@@ -0,0 +1,52 @@
+import cv2
+import numpy as np
+
+HASH_SIZE = 8
+"""A dHash is HASH_SIZE * HASH_SIZE bits long."""
+
+_POPCOUNT = np.array([bin(byte).count("1") for byte in range(256)], dtype=np.uint8)
+"""Number of bits set in each possible byte."""
+
+
+def dhash(imgs: np.ndarray) -> np.ndarray:
+    """
+    Difference hash of grayscale images: shrink to (HASH_SIZE + 1)xHASH_SIZE
+    and keep whether each pixel is brighter than its left neighbour.
+
+    Params
+        - imgs: one grayscale image or a stack of shape (N, height, width)
+    Returns
+        - the packed hashes, shape (HASH_SIZE,) or (N, HASH_SIZE) of uint8
+    """
+    stack = imgs[np.newaxis] if imgs.ndim == 2 else imgs
+    small = np.array(
+        [
+            cv2.resize(img, (HASH_SIZE + 1, HASH_SIZE), interpolation=cv2.INTER_AREA)
+            for img in stack
+        ],
+        dtype=np.int16,
+    ).reshape(len(stack), HASH_SIZE, HASH_SIZE + 1)
+    bits = small[:, :, 1:] > small[:, :, :-1]
+    hashes = np.packbits(bits.reshape(len(stack), HASH_SIZE * HASH_SIZE), axis=1)
+    return hashes[0] if imgs.ndim == 2 else hashes
+
+
+class HammingIndex:
+    """Find the hashes nearest to a query in Hamming distance."""
+
+    def __init__(self, hashes: np.ndarray):
+        self.hashes = hashes.reshape(-1, HASH_SIZE)
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def distances(self, query: np.ndarray) -> np.ndarray:
+        """Hamming distance between `query` and every indexed hash."""
+        return _POPCOUNT[np.bitwise_xor(self.hashes, query)].sum(axis=1, dtype=np.intp)
+
+    def nearest(self, query: np.ndarray, k: int) -> np.ndarray:
+        """Return the rows of the `k` hashes nearest to `query`, in ascending row order."""
+        if k >= len(self):
+            return np.arange(len(self))
+        rows = np.argpartition(self.distances(query), k)[:k]
+        return np.sort(rows)
@@ -0,0 +1,54 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from cv2.typing import MatLike
+
+import cv2
+import logging
+
+_warning = logging.getLogger("PhotoWriter").warning
+"""Custom Logger warning function. Print a message only shown when DEBUG mode is activated."""
+
+
+class PhotoWriter:
+    """
+    Encode and write photos in background threads, so taking a photo does not
+    stall the render loop.
+
+    At most `max_pending` photos wait to be written: when the queue is full, new
+    photos are refused instead of blocking the caller.
+    """
+
+    def __init__(self, max_workers: int = 2, max_pending: int = 16):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="PhotoWriter")
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    @staticmethod
+    def _write(image: MatLike, path: str) -> str:
+        # Mirrored, as the camera preview is
+        if not cv2.imwrite(path, cv2.flip(image, 1)):
+            raise OSError(f"Photo could not be written at {path}")
+        return path
+
+    def _release(self, future: Future):
+        self._slots.release()
+        if future.exception() is not None:
+            _warning(str(future.exception()))
+
+    def save(self, image: MatLike, path: str) -> Future | None:
+        """
+        Queue the BGR camera `image` to be written at `path`, the format given by its extension.
+        `image` must not be modified afterwards.
+
+        Returns
+            - a Future of the written path, None if too many photos are already waiting.
+        """
+        if not self._slots.acquire(blocking=False):
+            _warning(f"Too many photos waiting to be written, {path} is skipped.")
+            return None
+        future = self._executor.submit(self._write, image, path)
+        future.add_done_callback(self._release)
+        return future
+
+    def stop(self):
+        """Wait for the queued photos to be written."""
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,19 @@
+import signal
+import cv2
+
+
+def reset_signal_handlers():
+    """
+    Restore the default SIGTERM handler of a child process and ignore SIGINT.
+    The handlers inherited from pygame would keep it from being terminated, and Ctrl+C
+    is handled by the main process.
+    """
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def init_pool_worker():
+    """Initializer of the processes of a `multiprocessing.Pool`."""
+    reset_signal_handlers()
+    # The workers already use every core
+    cv2.setNumThreads(1)
@@ -0,0 +1,100 @@
+import json
+import os
+import numpy as np
+from cv2.typing import MatLike
+from typing import Dict, List, Tuple
+
+import logging
+
+from .atomic_file import atomic_write
+from .compare_images import load_comparison_img
+
+_warning = logging.getLogger("ReferenceCache").warning
+"""Custom Logger warning function. Print a message only shown when DEBUG mode is activated."""
+
+CacheKey = Tuple[int, str, int, int]
+"""(user id, picture path, picture mtime in ns, picture size in bytes)"""
+
+
+class ReferenceCache:
+    """
+    On-disk cache of the users pictures already resized and grayscaled for comparison.
+
+    The pictures are stored as one (N, height, width) matrix in a `.npy` file which is
+    memory-mapped on load, next to a JSON index of the `CacheKey` of each row. Only the
+    pictures that are new or whose file changed since the last load are decoded again.
+    """
+
+    def __init__(self, directory: str, compare_size=(64, 64)):
+        self.directory = directory
+        self.compare_size = compare_size
+        self.matrix_path = os.path.join(directory, "references.npy")
+        self.index_path = os.path.join(directory, "references.json")
+
+    @staticmethod
+    def _key(user_id: int, path: str) -> CacheKey | None:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (user_id, path, stat.st_mtime_ns, stat.st_size)
+
+    def _read(self) -> Tuple[Dict[CacheKey, int], np.ndarray | None]:
+        """Map the cached matrix. Return the row of each cached key and the matrix."""
+        try:
+            with open(self.index_path) as f:
+                index = json.load(f)
+            matrix = np.load(self.matrix_path, mmap_mode="r")
+        except (OSError, ValueError):
+            return {}, None
+        entries = index.get("entries", [])
+        width, height = self.compare_size
+        if (
+            index.get("compare_size") != list(self.compare_size)
+            or matrix.shape != (len(entries), height, width)
+            or matrix.dtype != np.uint8
+        ):
+            return {}, None
+        return {tuple(entry): row for row, entry in enumerate(entries)}, matrix
+
+    def _write(self, keys: List[CacheKey], imgs: List[MatLike]):
+        """Replace the cache content with `imgs`, stored under their respective `keys`."""
+        width, height = self.compare_size
+        matrix = np.stack(imgs) if imgs else np.empty((0, height, width), np.uint8)
+        try:
+            with atomic_write(self.matrix_path, "wb") as f:
+                np.save(f, matrix)
+            with atomic_write(self.index_path) as f:
+                json.dump({"compare_size": list(self.compare_size), "entries": keys}, f)
+        except OSError as e:
+            _warning(f"Card references cache could not be written in {self.directory}: {e}")
+
+    def load(self, user_ids: List[int], paths: List[str]) -> List[MatLike | None]:
+        """
+        Return the comparison image of each `paths` picture, in the same order.
+        Rewrite the cache if the pictures to cache are not the cached ones anymore: a picture
+        which fails to load is decoded again on each load, but does not rewrite the cache.
+
+        Params
+            - user_ids: id of the user owning each picture
+            - paths: path of each user picture
+        Returns
+            - the resized grayscale images, None for the ones that failed to load
+        """
+        rows, matrix = self._read()
+        imgs = []
+        valid_keys, valid_imgs = [], []
+        for user_id, path in zip(user_ids, paths):
+            key = self._key(user_id, path)
+            row = rows.get(key)
+            if row is not None:
+                img = matrix[row]
+            else:
+                img = load_comparison_img(path, self.compare_size)
+            imgs.append(img)
+            if key is not None and img is not None:
+                valid_keys.append(key)
+                valid_imgs.append(img)
+        if set(valid_keys) != rows.keys():
+            self._write(valid_keys, valid_imgs)
+        return imgs
@@ -0,0 +1,17 @@
+from module_camera.atomic_file import atomic_write
+import os
+import pytest
+
+
+def test_failed_write_keeps_the_file(tmp_path):
+    path = str(tmp_path / "sub" / "data.json")
+    with atomic_write(path) as f:
+        f.write("first")
+    with pytest.raises(RuntimeError):
+        with atomic_write(path) as f:
+            f.write("second")
+            raise RuntimeError()
+    with open(path) as f:
+        assert f.read() == "first"
+    # The temporary file of the failed write was removed
+    assert os.listdir(tmp_path / "sub") == ["data.json"]
@@ -0,0 +1,20 @@
+from module_camera.card_detection import scan_cards
+from module_camera.benchmarks.synthetic_cards import synthetic_card, synthetic_frame
+import numpy as np
+
+
+def test_downscaled_scan_corners():
+    rng = np.random.default_rng(0)
+    errors = []
+    for _ in range(12):
+        # Scanned at a quarter of the resolution
+        frame = synthetic_frame(synthetic_card(rng), rng, frame_size=(1920, 1080))
+        full_contours, _ = scan_cards(frame, max_size=None)
+        contours, _ = scan_cards(frame)
+        if len(full_contours) != 1 or len(contours) != 1:
+            continue
+        full_corners, corners = full_contours[0].reshape(-1, 2), contours[0].reshape(-1, 2)
+        errors.append(np.linalg.norm(full_corners[:, None] - corners[None], axis=2).min(axis=1).max())
+    assert len(errors) >= 10
+    # Up to 6 pixels before the refinement at the full resolution
+    assert max(errors) <= 3
@@ -0,0 +1,38 @@
+from module_camera.card_enrollment import Enrollment, read_enrollments
+import os
+
+
+def test_directory_file_names(tmp_path):
+    for name in ("ada_lovelace.png", "jean_luc_picard.JPG", "nobody.png", "notes.txt"):
+        (tmp_path / name).write_bytes(b"")
+    enrollments, errors = read_enrollments(str(tmp_path))
+    assert enrollments == [
+        Enrollment("ada", "lovelace", os.path.join(str(tmp_path), "ada_lovelace.png")),
+        Enrollment("jean", "luc picard", os.path.join(str(tmp_path), "jean_luc_picard.JPG")),
+    ]
+    assert len(errors) == 1 and errors[0].startswith("nobody.png")
+
+
+def test_csv_invalid_rows_are_reported(tmp_path):
+    source = tmp_path / "classe.csv"
+    source.write_text("prenom,nom,carte\nAda,Lovelace,ada.png\nAlan,Turing\n,Hopper,grace.png\n", encoding="utf-8")
+    enrollments, errors = read_enrollments(str(source))
+    assert enrollments == [Enrollment("Ada", "Lovelace", os.path.join(str(tmp_path), "ada.png"))]
+    assert errors == [f"{source} line 3: missing field", f"{source} line 4: empty field"]
+
+
+def test_csv_encodings(tmp_path):
+    # An Excel export, in cp1252
+    source = tmp_path / "excel.csv"
+    source.write_bytes("prenom,nom,carte\r\nHélène,Bérard,hélène.png\r\n".encode("cp1252"))
+    enrollments, errors = read_enrollments(str(source))
+    assert enrollments == [Enrollment("Hélène", "Bérard", os.path.join(str(tmp_path), "hélène.png"))] and errors == []
+
+    source = tmp_path / "utf8.csv"
+    source.write_bytes("\ufeffprenom,nom,carte\nHélène,Bérard,hélène.png\n".encode("utf-8"))
+    assert read_enrollments(str(source))[0] == enrollments
+
+    source = tmp_path / "binary.csv"
+    source.write_bytes(b"prenom,nom,carte\n\x81\x8d,x,y.png\n")
+    enrollments, errors = read_enrollments(str(source))
+    assert enrollments == [] and len(errors) == 1 and errors[0].startswith(f"{source}: unknown text encoding")
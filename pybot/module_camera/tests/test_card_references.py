@@ -0,0 +1,36 @@
+from module_camera.card_references import CardReferences
+from module_camera.benchmarks.synthetic_cards import synthetic_card
+import numpy as np
+import pickle
+import cv2
+
+
+def test_copy_follows_the_changes(tmp_path):
+    rng = np.random.default_rng(5)
+    cards, paths = [], []
+    for i in range(6):
+        cards.append(synthetic_card(rng, size=200))
+        paths.append(str(tmp_path / f"card{i}.png"))
+        cv2.imwrite(paths[-1], cards[-1])
+    references = CardReferences([1, 2, 3, 4], paths[:4], [None] * 4, [0.0] * 4, str(tmp_path / "cache"))
+    references.get_matcher("ssim")
+    copy = pickle.loads(pickle.dumps(references))
+    # Only what the matchers are built from is sent
+    assert copy.matchers == {} and copy.generation == references.generation
+
+    references.add(5, paths[4], priority=2.0)
+    references.remove(0)
+    references.update(1, 3, paths[5], None)
+    references.set_marker_id(0, 7)
+    copy.apply_changes(references.changes_since(copy.generation))
+    for attribute in ("user_ids", "image_paths", "marker_ids", "priorities", "generation"):
+        assert getattr(copy, attribute) == getattr(references, attribute)
+    assert references.changes_since(copy.generation) == []
+
+    expected = references.get_matcher("ssim").get_matches(cards, 0.9, 0.95)
+    assert [idx for idx, _ in expected] == [None, 0, None, 2, 3, 1]
+    assert copy.get_matcher("ssim").get_matches(cards, 0.9, 0.95) == expected
+
+    # Other references do not come from these ones
+    other = CardReferences([], [], [], [], str(tmp_path / "cache"))
+    assert references.changes_since(other.generation) is None
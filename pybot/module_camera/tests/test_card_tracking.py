@@ -0,0 +1,56 @@
+from module_camera.card_tracking import CardTracks
+from module_camera.benchmarks.synthetic_cards import synthetic_card
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def cards():
+    rng = np.random.default_rng(7)
+    return [synthetic_card(rng, size=100) for _ in range(3)]
+
+
+def square(x, y, size=100):
+    return np.array([[[x, y]], [[x + size, y]], [[x + size, y + size]], [[x, y + size]]], dtype=np.int32)
+
+
+class Matcher:
+    """Match each card image to the identical one of `cards`, counting the images matched."""
+
+    def __init__(self, cards):
+        self.cards = cards
+        self.matched = 0
+
+    def __call__(self, images):
+        self.matched += len(images)
+        return [(next(i for i, card in enumerate(self.cards) if np.array_equal(card, img)), 0.9) for img in images]
+
+
+def test_static_card_is_matched_until_its_identity_is_certain(cards):
+    tracks = CardTracks(min_votes=3)
+    matcher = Matcher(cards)
+    for _ in range(6):
+        identities, scores = tracks.update([square(10, 10)], [cards[0]], matcher, generation=1)
+        assert identities == [0] and scores == [0.9]
+    assert matcher.matched == 3 and tracks.matches_reused == 3
+
+    # The tracks do not outlive the references they were matched with
+    tracks.update([square(10, 10)], [cards[0]], matcher, generation=2)
+    assert matcher.matched == 4
+
+
+def test_swapped_card_takes_a_new_identity(cards):
+    tracks = CardTracks(min_votes=3)
+    matcher = Matcher(cards)
+    tracks.update([square(10, 10), square(300, 10)], [cards[0], cards[1]], matcher, generation=1)
+    # Another card put in the place of the first one, before its identity is certain
+    identities, _ = tracks.update([square(12, 10), square(300, 10)], [cards[2], cards[1]], matcher, generation=1)
+    assert identities == [2, 1]
+    assert list(tracks.tracks[0].votes) == [2]
+
+    # And once it is certain, so it is not matched anymore
+    for _ in range(3):
+        tracks.update([square(12, 10), square(300, 10)], [cards[2], cards[1]], matcher, generation=1)
+    matched = matcher.matched
+    identities, _ = tracks.update([square(12, 10), square(300, 10)], [cards[0], cards[1]], matcher, generation=1)
+    assert identities == [0, 1] and matcher.matched == matched + 1
@@ -0,0 +1,111 @@
+from module_camera.compare_images import ImageComparator
+from module_camera.benchmarks.synthetic_cards import synthetic_card
+from skimage.metrics import structural_similarity as ssim
+import numpy as np
+import cv2
+import pytest
+
+
+@pytest.fixture
+def card_paths(tmp_path):
+    rng = np.random.default_rng(42)
+    paths = []
+    for i in range(12):
+        img = rng.integers(0, 256, (200, 200, 3), dtype=np.uint8)
+        img = cv2.GaussianBlur(img, (9, 9), 3)
+        path = str(tmp_path / f"card{i}.png")
+        cv2.imwrite(path, img)
+        paths.append(path)
+    return paths
+
+
+def test_batched_ssim_matches_skimage(card_paths):
+    comparator = ImageComparator(card_paths + ["missing.png"])
+    candidate = cv2.imread(card_paths[5])
+    candidate_gray = cv2.resize(cv2.cvtColor(candidate, cv2.COLOR_BGR2GRAY), (64, 64))
+
+    scores = np.concatenate([s for _, s in comparator._iter_scores(candidate)])
+    expected = [ssim(candidate_gray, ref) for ref in comparator.ref_images if ref is not None]
+    assert np.allclose(scores, expected)
+
+
+def test_get_match_idx_thresholds(card_paths):
+    comparator = ImageComparator(["missing.png"] + card_paths)
+    candidate = cv2.imread(card_paths[3])
+    assert comparator.get_match_idx(candidate, 0.75, 0.85) == 4
+    assert comparator.get_match_idx(candidate, 1.1, 1.1) is None
+
+
+def test_hash_prefilter_keeps_match(card_paths):
+    comparator = ImageComparator(card_paths, prefilter_k=3)
+    candidate = cv2.warpAffine(
+        cv2.imread(card_paths[7]), np.float32([[1, 0, 2], [0, 1, 1]]), (200, 200)
+    )
+    assert comparator.get_match_idx(candidate, 0.5, 0.99) == 7
+    assert sum(len(rows) for rows, _ in comparator._iter_scores(candidate)) == 3
+
+
+def test_pyramid_prunes_other_cards(card_paths):
+    comparator = ImageComparator(card_paths[1:], pyramid_sizes=((16, 16), (32, 32)))
+    comparator.add_reference(card_paths[0])
+    comparator.remove_reference(2)
+    candidate = cv2.warpAffine(
+        cv2.imread(card_paths[0]), np.float32([[1, 0, 2], [0, 1, 1]]), (200, 200)
+    )
+    assert comparator.get_match_idx(candidate, 0.8, 0.99) == len(card_paths) - 2
+    assert sum(len(rows) for rows, _ in comparator._iter_scores(candidate, 0.6)) == 1
+
+
+def test_priorities_search_first(card_paths):
+    comparator = ImageComparator(card_paths + [card_paths[4]], priorities=[0] * 8 + [2] + [0] * 3 + [1])
+    candidate = cv2.imread(card_paths[4])
+    rows, _ = next(comparator._iter_scores(candidate))
+    assert list(rows[:2]) == [8, 12]
+    # Both copies of the card pass stop_threshold, the one of highest priority wins
+    assert comparator.get_match_idx(candidate, 0.75, 0.85) == 12
+    comparator.set_priorities([0] * 4 + [1] + [0] * 8)
+    assert comparator.get_match_idx(candidate, 0.75, 0.85) == 4
+    comparator.remove_reference(0)
+    assert comparator.get_match_idx(candidate, 0.75, 0.85) == 3
+
+
+def test_get_matches_batch(card_paths):
+    comparator = ImageComparator(card_paths, prefilter_k=3, pyramid_sizes=((16, 16), (32, 32)))
+    shift = np.float32([[1, 0, 2], [0, 1, 1]])
+    noise = np.random.default_rng(0).integers(0, 256, (200, 200, 3), dtype=np.uint8)
+    frames = [cv2.warpAffine(cv2.imread(card_paths[i]), shift, (200, 200)) for i in (9, 2, 5)] + [noise]
+    matches = comparator.get_matches(frames, 0.5, 0.99)
+    assert [idx for idx, _ in matches] == [9, 2, 5, None]
+    assert [idx for idx, _ in matches] == [comparator.get_match_idx(frame, 0.5, 0.99) for frame in frames]
+    assert all(0.5 <= score < 0.99 for _, score in matches[:3]) and matches[3][1] == 0.0
+    assert comparator.get_matches([], 0.5, 0.99) == []
+
+
+def test_hash_prefilter_recall():
+    rng = np.random.default_rng(7)
+    cards = [synthetic_card(rng, size=200) for _ in range(300)]
+    refs = [cv2.resize(cv2.cvtColor(card, cv2.COLOR_BGR2GRAY), (64, 64)) for card in cards]
+    prefiltered = ImageComparator([], prefilter_k=32, fallback_k=32, pyramid_sizes=((16, 16), (32, 32)), ref_images=list(refs))
+    exhaustive = ImageComparator([], ref_images=list(refs))
+    expected = list(range(0, 300, 5))
+    frames = []
+    for i in expected:
+        # Slight perspective, lighting gradient and noise, which move the hash away from the reference one
+        corners = np.float32([[0, 0], [200, 0], [200, 200], [0, 200]])
+        matrix = cv2.getPerspectiveTransform(corners, corners + rng.normal(0, 1.5, (4, 2)).astype(np.float32))
+        frame = cv2.warpPerspective(cards[i], matrix, (200, 200), borderMode=cv2.BORDER_REPLICATE).astype(np.float32)
+        frame *= rng.uniform(0.7, 1.2) + np.linspace(-0.2, 0.2, 200, dtype=np.float32)[None, :, None] * rng.choice([-1, 1])
+        frame += rng.normal(0, 3, frame.shape)
+        frames.append(np.clip(frame, 0, 255).astype(np.uint8))
+    exhaustive_matches = [idx for idx, _ in exhaustive.get_matches(frames, 0.75, 0.85)]
+    prefiltered_matches = [idx for idx, _ in prefiltered.get_matches(frames, 0.75, 0.85)]
+    assert np.mean([m == e for m, e in zip(exhaustive_matches, expected)]) >= 0.95
+    assert prefiltered_matches == exhaustive_matches
+    # Some cards are only found by comparing them to the references outside of the prefilter
+    assert [idx for idx, _ in prefiltered._search(frames, 0.75, 0.85, "hash")] != exhaustive_matches
+
+    # A card not enrolled is only compared to both shortlists
+    unknown = synthetic_card(rng, size=200)
+    assert prefiltered.get_matches([unknown], 0.75, 0.85) == [(None, 0.0)]
+    gray = prefiltered._prepare_candidate(unknown)[None]
+    assert prefiltered._search_rows(gray, "hash").shape == prefiltered._search_rows(gray, "thumbnail").shape == (1, 32)
@@ -0,0 +1,29 @@
+from module_camera.lsh_index import LshIndex
+import numpy as np
+
+
+def test_updates_match_a_new_build():
+    rng = np.random.default_rng(3)
+    cards = [rng.integers(0, 256, (100, 32), dtype=np.uint8) for _ in range(26)]
+    index = LshIndex(min_key_bits=8)
+    index.add(np.concatenate(cards[:25]), np.repeat(np.arange(25), 100))
+    index.remove(4)
+    index.shift_labels(4)
+    index.add(cards[25], np.full(100, 24))
+    # Few changes, kept apart from the buckets directory until the next build
+    assert index._added_rows.shape[1] == 100 and index._removed == 100
+
+    expected = LshIndex(min_key_bits=8)
+    kept = cards[:4] + cards[5:]
+    expected.add(np.concatenate(kept), np.repeat(np.arange(len(kept)), 100))
+    # Queries near some indexed descriptors, a few bits flipped
+    queries = np.concatenate([cards[i][:10] for i in (2, 4, 7, 25)])
+    queries ^= (rng.random(queries.shape) < 0.02).astype(np.uint8) << rng.integers(0, 8, queries.shape).astype(np.uint8)
+
+    def neighbours(index):
+        query_idx, nearest, distances, _, second_distances = index.knn2(queries)
+        return query_idx, index.labels[nearest], distances, second_distances
+
+    for result, expected_result in zip(neighbours(index), neighbours(expected)):
+        assert np.array_equal(result, expected_result)
+    assert len(index) == len(expected) == 2500
@@ -0,0 +1,37 @@
+from module_camera.motion_gate import MotionGate
+import numpy as np
+import cv2
+
+
+def scene(card_value: int, rng) -> np.ndarray:
+    """Textured RGB frame in pygame layout, with a uniform card of `card_value` over 6% of it, and sensor noise."""
+    frame = cv2.GaussianBlur(np.random.default_rng(1).integers(0, 256, (640, 480, 3), dtype=np.uint8), (31, 31), 10)
+    frame[250:400, 170:320] = card_value
+    noise = rng.integers(-2, 3, frame.shape)
+    return np.clip(frame.astype(int) + noise, 0, 255).astype(np.uint8)
+
+
+def test_static_scene_is_not_scanned_again():
+    rng = np.random.default_rng(0)
+    gate = MotionGate()
+    thumbnail = gate.thumbnail(scene(200, rng))
+    assert gate.should_scan(thumbnail, "key")
+    gate.set_reference(thumbnail, "key")
+    assert not gate.should_scan(gate.thumbnail(scene(200, rng)), "key")
+    # The references of the other detection kinds are apart
+    assert gate.should_scan(gate.thumbnail(scene(200, rng)), "other key")
+
+    gate.reset("key")
+    assert gate.should_scan(gate.thumbnail(scene(200, rng)), "key")
+    assert (gate.hits, gate.misses) == (1, 3)
+
+
+def test_swapped_card_is_scanned():
+    rng = np.random.default_rng(0)
+    gate = MotionGate()
+    reference = gate.thumbnail(scene(200, rng))
+    gate.set_reference(reference, "key")
+    swapped = gate.thumbnail(scene(160, rng))
+    # The card covers too little of the frame to move the mean difference over the threshold
+    assert np.mean(cv2.absdiff(swapped, reference)) < gate.threshold
+    assert gate.should_scan(swapped, "key")
@@ -0,0 +1,87 @@
+from module_camera import reference_cache
+from module_camera.reference_cache import ReferenceCache
+from module_camera.benchmarks.synthetic_cards import synthetic_card
+import numpy as np
+import os
+import cv2
+import pytest
+
+
+@pytest.fixture
+def decoded(monkeypatch):
+    """Paths of the pictures decoded by the cache, instead of read from it."""
+    paths = []
+
+    def load_comparison_img(path, size):
+        paths.append(path)
+        return load(path, size)
+
+    load = reference_cache.load_comparison_img
+    monkeypatch.setattr(reference_cache, "load_comparison_img", load_comparison_img)
+    return paths
+
+
+@pytest.fixture
+def card_paths(tmp_path):
+    rng = np.random.default_rng(11)
+    paths = []
+    for i in range(4):
+        paths.append(str(tmp_path / f"card{i}.png"))
+        cv2.imwrite(paths[-1], synthetic_card(rng, size=120))
+    return paths
+
+
+def test_round_trip(tmp_path, card_paths, decoded):
+    imgs = ReferenceCache(str(tmp_path / "cache")).load([1, 2, 3, 4], card_paths)
+    assert decoded == card_paths
+    decoded.clear()
+    cached = ReferenceCache(str(tmp_path / "cache")).load([1, 2, 3, 4], card_paths)
+    assert decoded == []
+    assert all(np.array_equal(img, cached_img) for img, cached_img in zip(imgs, cached))
+
+    # Another compare size does not use the cached pictures
+    ReferenceCache(str(tmp_path / "cache"), compare_size=(32, 32)).load([1, 2, 3, 4], card_paths)
+    assert decoded == card_paths
+
+
+def test_changed_pictures_are_decoded_again(tmp_path, card_paths, decoded):
+    cache = ReferenceCache(str(tmp_path / "cache"))
+    cache.load([1, 2, 3, 4], card_paths)
+    decoded.clear()
+    # Same size, other mtime
+    stat = os.stat(card_paths[0])
+    os.utime(card_paths[0], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    # Other size
+    cv2.imwrite(card_paths[1], np.zeros((120, 120, 3), np.uint8))
+    imgs = cache.load([1, 2, 3, 4], card_paths)
+    assert decoded == card_paths[:2]
+    assert not imgs[1].any()
+    # The same picture of another user is another key
+    decoded.clear()
+    cache.load([1, 2, 3, 5], card_paths)
+    assert decoded == card_paths[3:]
+
+
+def test_removed_and_added_pictures(tmp_path, card_paths, decoded):
+    cache = ReferenceCache(str(tmp_path / "cache"))
+    cache.load([1, 2, 3], card_paths[:3])
+    cache.load([1, 3], card_paths[0:3:2])
+    rows, matrix = cache._read()
+    assert len(matrix) == 2 and {key[0] for key in rows} == {1, 3}
+    decoded.clear()
+    imgs = cache.load([1, 3, 4], card_paths[0:3:2] + card_paths[3:])
+    assert decoded == card_paths[3:] and len(imgs) == 3
+    assert {key[0] for key in cache._read()[0]} == {1, 3, 4}
+
+
+def test_bad_picture_does_not_rewrite_the_cache(tmp_path, card_paths, monkeypatch):
+    bad_path = str(tmp_path / "bad.png")
+    with open(bad_path, "wb") as f:
+        f.write(b"not a picture")
+    cache = ReferenceCache(str(tmp_path / "cache"))
+    assert cache.load([1, 2], [card_paths[0], bad_path])[1] is None
+    writes = []
+    monkeypatch.setattr(cache, "_write", lambda keys, imgs: writes.append(keys))
+    imgs = cache.load([1, 2], [card_paths[0], bad_path])
+    assert imgs[0] is not None and imgs[1] is None
+    assert writes == []
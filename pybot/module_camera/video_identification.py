@@ -0,0 +1,223 @@
+"""
+Identify the users cards in recorded videos, to audit a session or tune the thresholds on real footage.
+
+The frames are split in segments identified in parallel by a pool of processes, each
+frame independently of the others, with the pipeline and the users of the robot.
+Each card found is written as one row of a CSV file, or one entry of a JSON file.
+
+Usage, from the project root:
+    python -m pybot.module_camera.video_identification session1.avi session2.mp4 --output session.csv
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import time
+import cv2
+from cv2.typing import MatLike
+from typing import Dict, List, NamedTuple, Tuple
+
+from ..module_webapp import create_app
+from .card_detection import detect_cards
+from .cli import log
+from .match_cache import MatchCache
+from .UserCardsTracker import UserCardsTracker
+from .card_references import MATCHERS
+from .processes import init_pool_worker
+
+SEGMENT_FRAMES = 300
+"""Number of video frames per task of the pool: long enough to amortize the seek, short enough to balance the cores."""
+
+OUTPUT_FIELDS = ("video", "frame", "time", "card", "user_id", "user", "contour")
+"""Columns of the CSV output, keys of the JSON output entries."""
+
+DEFAULT_ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+"""Directory of the robot database and static files, the one `Robot.demarrer_webapp` uses."""
+
+
+class Segment(NamedTuple):
+    """Frames `start` to `stop` excluded of a video, to the end if `stop` is None."""
+
+    path: str
+    start: int
+    stop: int | None
+
+
+def pygame_layout(image: MatLike) -> MatLike:
+    """RGB frame in pygame layout (width, height, 3) of a BGR video `image`, as `Camera._update_frame` makes it."""
+    return cv2.rotate(cv2.cvtColor(image, cv2.COLOR_BGR2RGB), cv2.ROTATE_90_COUNTERCLOCKWISE)
+
+
+def video_contour(contour: MatLike, width: int) -> List[List[int]]:
+    """Points (x, y) in the `width` pixels wide video image of a `contour` found in its `pygame_layout` frame."""
+    points = contour.reshape(-1, 2)
+    return [[width - 1 - int(row), int(column)] for column, row in points]
+
+
+def video_segments(path: str, segment_frames: int = SEGMENT_FRAMES) -> Tuple[List[Segment], float]:
+    """
+    Split the video at `path` in segments of `segment_frames` frames, the last one up to the end.
+    Raise FileNotFoundError if it can not be opened.
+
+    Returns
+        - the segments
+        - the video frame rate, 0 if unknown
+    """
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise FileNotFoundError(f"Video {path} could not be opened.")
+    # The count is only an estimate for some formats, the last segment reads until the end
+    frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = capture.get(cv2.CAP_PROP_FPS)
+    capture.release()
+    starts = list(range(0, max(frame_count, 1), segment_frames))
+    stops = starts[1:] + [None]
+    return [Segment(path, start, stop) for start, stop in zip(starts, stops)], fps
+
+
+_matcher = None
+_identification: Tuple[float, float, int, int] = None
+"""(min_threshold, stop_threshold, generation, step) of the worker processes."""
+
+
+def _init_worker(matcher, min_threshold: float, stop_threshold: float, generation: int, step: int):
+    global _matcher, _identification
+    init_pool_worker()
+    _matcher = matcher
+    _identification = (min_threshold, stop_threshold, generation, step)
+
+
+def _identify_segment(segment: Segment) -> Tuple[Segment, List[Tuple[int, List[int | None], List[List[List[int]]]]]]:
+    """
+    Identify the cards of every `step`-th frame of `segment`.
+
+    Returns
+        - `segment`
+        - (frame index, match index of each card, contour of each card in the video image) of each frame with cards
+    """
+    min_threshold, stop_threshold, generation, step = _identification
+    capture = cv2.VideoCapture(segment.path)
+    # Same cards on consecutive frames are matched once
+    cache = MatchCache()
+    results = []
+    frame_idx = segment.start + (-segment.start) % step
+    capture.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
+    while segment.stop is None or frame_idx < segment.stop:
+        ret, image = capture.read()
+        if not ret:
+            break
+        detection = detect_cards(pygame_layout(image), _matcher, min_threshold, stop_threshold, generation, cache=cache)
+        if detection.contours:
+            width = image.shape[1]
+            contours = [video_contour(contour, width) for contour in detection.contours]
+            results.append((frame_idx, detection.match_indices, contours))
+        frame_idx += 1
+        # Skipped frames are grabbed without being decoded
+        while frame_idx % step and (segment.stop is None or frame_idx < segment.stop):
+            if not capture.grab():
+                break
+            frame_idx += 1
+    capture.release()
+    return segment, results
+
+
+def identify_videos(
+    paths: List[str],
+    tracker: UserCardsTracker,
+    method: str = "ssim",
+    min_threshold: float = 0.75,
+    stop_threshold: float = 0.85,
+    step: int = 1,
+    processes: int | None = None,
+    segment_frames: int = SEGMENT_FRAMES,
+) -> List[dict]:
+    """
+    Identify the cards of every `step`-th frame of the videos at `paths` with the `tracker` users.
+
+    Params
+        - method, min_threshold, stop_threshold: see `UserCardsTracker.detect_cards`
+        - processes: size of the pool, one process per core if not given
+    Returns
+        - one entry per card found, with the `OUTPUT_FIELDS` keys, by video then frame
+    """
+    segments, fps = [], {}
+    for path in paths:
+        path_segments, fps[path] = video_segments(path, segment_frames)
+        segments += path_segments
+    matcher = tracker.get_matcher(method)
+    # "fork" shares the matcher with the workers instead of pickling it, see `CardDetectionWorker`
+    context = multiprocessing.get_context("fork")
+    results: Dict[Segment, list] = {}
+    start = time.perf_counter()
+    with context.Pool(
+        processes,
+        initializer=_init_worker,
+        initargs=(matcher, min_threshold, stop_threshold, tracker.generation, step),
+    ) as pool:
+        for segment, segment_results in pool.imap_unordered(_identify_segment, segments):
+            results[segment] = segment_results
+            log(f"{len(results)}/{len(segments)} segments identified in {time.perf_counter() - start:.1f}s")
+    entries = []
+    for segment in segments:
+        for frame_idx, match_indices, contours in results[segment]:
+            for card, (match_idx, contour) in enumerate(zip(match_indices, contours)):
+                user = None if match_idx is None else tracker.users[match_idx]
+                entries.append({
+                    "video": segment.path,
+                    "frame": frame_idx,
+                    "time": frame_idx / fps[segment.path] if fps[segment.path] else None,
+                    "card": card,
+                    "user_id": None if user is None else user.id,
+                    "user": None if user is None else f"{user.first_name} {user.last_name}",
+                    "contour": contour,
+                })
+    return entries
+
+
+def write_entries(entries: List[dict], path: str):
+    """Write `entries` as JSON if `path` ends with .json, else as CSV with the contours as JSON."""
+    if path.lower().endswith(".json"):
+        with open(path, "w") as f:
+            json.dump(entries, f, indent=2)
+        return
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, OUTPUT_FIELDS)
+        writer.writeheader()
+        for entry in entries:
+            writer.writerow(entry | {"contour": json.dumps(entry["contour"])})
+
+
+def main(argv: List[str] | None = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("videos", nargs="+")
+    parser.add_argument("--output", default="identifications.csv", help="CSV or JSON file to write")
+    parser.add_argument("--method", choices=list(MATCHERS), default="ssim")
+    parser.add_argument("--min-threshold", type=float, default=0.75)
+    parser.add_argument("--stop-threshold", type=float, default=0.85)
+    parser.add_argument("--step", type=int, default=1, help="identify one frame every STEP frames")
+    parser.add_argument("--processes", type=int, default=None, help="default: one per core")
+    parser.add_argument("--root-dir", default=DEFAULT_ROOT_DIR, help="directory of the robot database")
+    args = parser.parse_args(argv)
+    if args.step < 1:
+        parser.error("--step must be at least 1")
+    tracker = UserCardsTracker(create_app(root_dir=args.root_dir))
+    log(f"{len(tracker.users)} users loaded")
+    try:
+        entries = identify_videos(
+            args.videos,
+            tracker,
+            args.method,
+            args.min_threshold,
+            args.stop_threshold,
+            args.step,
+            args.processes,
+        )
+    except FileNotFoundError as e:
+        parser.error(str(e))
+    write_entries(entries, args.output)
+    log(f"{len(entries)} cards written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,7 @@ import os
 import functools
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import inspect, text
 from sqlalchemy_media import (
     StoreManager,
     FileSystemStore,
@@ -13,6 +14,21 @@ from .views import admin_bp, frontend_bp
 from .api import api_bp
 
 
+def add_missing_columns():
+    """Add the model columns missing from the existing tables, and their indexes: `db.create_all` only creates the missing tables."""
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        missing = [column for column in table.columns if column.name not in columns]
+        for column in missing:
+            column_type = column.type.compile(db.engine.dialect)
+            db.session.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+        db.session.commit()
+        if missing:
+            for index in table.indexes:
+                index.create(db.engine, checkfirst=True)
+
+
 def create_app(root_dir: str = os.path.dirname(os.path.abspath(__file__))):
     """Create the flask application.
 
@@ -42,6 +58,7 @@ def create_app(root_dir: str = os.path.dirname(os.path.abspath(__file__))):
     db.init_app(app)
     with app.app_context():
         db.create_all()  # ensure db table creation as defined by our models
+        add_missing_columns()
 
     # Blueprints
     app.register_blueprint(api_bp)  # prefix '/api' is already included
@@ -2,6 +2,7 @@ from sqlalchemy.exc import IntegrityError
 from pybot.module_webapp.app import db, StoreManager
 from pybot.module_webapp.models import (
     User,
+    MarkerCounter,
     DrawingModel,
     UserCreate,
     UserResponse,
@@ -95,6 +96,32 @@ class UserDAO(object):
         db.session.refresh(new_user)
         return new_user
 
+    def create_many(self, users: List[UserCreate]) -> List[UserResponse]:
+        """Create several users in a single transaction: none is created if one fails.
+
+        Keyword arguments:
+        users -- The user fields dictionary of each user.
+        """
+        with StoreManager(db.session):
+            new_users = []
+            try:
+                for fields in users:
+                    picture = DrawingModel.create_from(fields["picture"])
+                    picture.get_thumbnail(width=48, auto_generate=True)
+                    new_user = User(**(fields | {"picture": picture}))
+                    # Added before it is validated, so its picture is deleted by the rollback too
+                    db.session.add(new_user)
+                    new_users.append(new_user)
+                    parse_openai_chat_messages(new_user)
+                db.session.commit()
+            except Exception:
+                # Also deletes the pictures already stored
+                db.session.rollback()
+                raise
+        for new_user in new_users:
+            db.session.refresh(new_user)
+        return new_users
+
     def update(self, id: UserId, user_patch: UserPatch) -> UserResponse:
         """Update the fields of the user with corresponding ID.
 
@@ -136,6 +163,35 @@ class UserDAO(object):
             db.session.commit()
             return user
 
+    def allocate_marker(self, id: UserId, marker_count: int) -> int:
+        """Return the marker id of the user with corresponding ID, given on first call.
+
+        The markers are given in turn, so the marker of a deleted user, maybe still printed
+        on its card, is only given again after all the other ones.
+        Raise ValueError if the `marker_count` markers are all given.
+
+        Keyword arguments:
+        id -- The user ID.
+        marker_count -- The number of markers, ids from 0 to `marker_count - 1`.
+        """
+        user = User.query.get(id)
+        raise_NoResultFound_if_none(user, id)
+        if user.marker_id is not None:
+            return user.marker_id
+        counter = MarkerCounter.query.get(1) or MarkerCounter(id=1, allocated=0)
+        given = {marker_id for (marker_id,) in db.session.query(User.marker_id).filter(User.marker_id.isnot(None))}
+        for offset in range(marker_count):
+            marker_id = (counter.allocated + offset) % marker_count
+            if marker_id not in given:
+                break
+        else:
+            raise ValueError(f"All the {marker_count} markers are already given to other users")
+        user.marker_id = marker_id
+        counter.allocated = counter.allocated + offset + 1
+        db.session.add(counter)
+        db.session.commit()
+        return marker_id
+
     def search(self, first_name: str) -> List[UserResponse]:
         return User.query.filter(User.first_name.like(f"%{first_name}%")).all()
 
@@ -44,3 +44,13 @@ class User(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     openai_chat_messages = db.Column(db.JSON)
     picture = db.Column(DrawingModel.as_mutable_json())
+    marker_id = db.Column(db.Integer, unique=True, index=True)
+    """Id of the marker printed on the card of the user, None if it has none. See `UserDAO.allocate_marker`."""
+
+
+class MarkerCounter(db.Model):
+    """Number of markers ever given to the users, the next marker to give is the following free one."""
+
+    __tablename__ = "marker_counter"
+    id = db.Column(db.Integer, primary_key=True)
+    allocated = db.Column(db.Integer, nullable=False, default=0)
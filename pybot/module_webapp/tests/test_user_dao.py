@@ -0,0 +1,78 @@
+from pybot.module_webapp import create_app
+from pybot.module_webapp.dao.user import UserDAO
+from pybot.module_webapp.models import User
+import numpy as np
+import cv2
+import io
+import os
+import pytest
+import sqlite3
+
+
+def card_png() -> io.BytesIO:
+    ok, png = cv2.imencode(".png", np.full((200, 200, 3), 255, np.uint8))
+    return io.BytesIO(png.tobytes())
+
+
+def stored_files(app) -> int:
+    return sum(len(files) for _, _, files in os.walk(app.static_folder))
+
+
+def test_create_many_is_all_or_nothing(tmp_path):
+    app = create_app(root_dir=str(tmp_path))
+    dao = UserDAO()
+    with app.app_context():
+        users = dao.create_many([
+            {"first_name": "Ada", "last_name": "Lovelace", "picture": card_png()},
+            {"first_name": "Alan", "last_name": "Turing", "picture": card_png()},
+        ])
+        assert [u.first_name for u in users] == ["Ada", "Alan"]
+        assert len({u.id for u in users}) == 2 and User.query.count() == 2
+        files = stored_files(app)
+
+        with pytest.raises(Exception):
+            dao.create_many([
+                {"first_name": "Grace", "last_name": "Hopper", "picture": card_png()},
+                # Not a list of chat messages
+                {"first_name": "Bad", "last_name": "Messages", "picture": card_png(), "openai_chat_messages": "{}"},
+            ])
+        assert User.query.count() == 2
+        # The pictures of the rolled back users are deleted
+        assert stored_files(app) == files
+
+
+def test_markers_are_given_in_turn(tmp_path):
+    app = create_app(root_dir=str(tmp_path))
+    dao = UserDAO()
+    with app.app_context():
+        users = dao.create_many([
+            {"first_name": f"User{i}", "last_name": "Test", "picture": card_png()} for i in range(4)
+        ])
+        ids = [u.id for u in users]
+        assert [dao.allocate_marker(id, marker_count=3) for id in ids[:3]] == [0, 1, 2]
+        assert dao.allocate_marker(ids[1], marker_count=3) == 1
+        with pytest.raises(ValueError):
+            dao.allocate_marker(ids[3], marker_count=3)
+
+        # The marker of a deleted user is given again only once the others were
+        dao.delete(ids[2])
+        new_user = dao.create_many([{"first_name": "New", "last_name": "Test", "picture": card_png()}])[0]
+        assert dao.allocate_marker(new_user.id, marker_count=4) == 3
+        assert dao.allocate_marker(ids[3], marker_count=4) == 2
+        assert dao.get(new_user.id).marker_id == 3
+
+
+def test_missing_columns_are_added(tmp_path):
+    # Database created before the users had a marker
+    connection = sqlite3.connect(tmp_path / "database.db")
+    connection.execute(
+        "CREATE TABLE user (id INTEGER PRIMARY KEY, first_name VARCHAR(100) NOT NULL, last_name VARCHAR(100) NOT NULL,"
+        " created_at DATETIME, openai_chat_messages JSON, picture JSON)"
+    )
+    connection.execute("INSERT INTO user (first_name, last_name) VALUES ('Ada', 'Lovelace')")
+    connection.commit()
+    connection.close()
+    app = create_app(root_dir=str(tmp_path))
+    with app.app_context():
+        assert UserDAO().allocate_marker(1, marker_count=10) == 0
+        assert User.query.get(1).marker_id == 0
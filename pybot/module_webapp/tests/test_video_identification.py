@@ -0,0 +1,55 @@
+from pybot.module_webapp import create_app
+from pybot.module_webapp.dao.user import UserDAO
+from pybot.module_camera.benchmarks.synthetic_cards import enrollment_frame, framed_card, synthetic_card
+from pybot.module_camera.card_enrollment import enrollment_picture
+from pybot.module_camera.video_identification import main, pygame_layout, video_contour
+import numpy as np
+import cv2
+import io
+import json
+
+
+def test_video_contour():
+    image = np.zeros((48, 64, 3), np.uint8)
+    image[10, 30] = 255
+    rows, columns = np.nonzero(pygame_layout(image)[..., 0])
+    contour = np.array([[[columns[0], rows[0]]]])
+    assert video_contour(contour, 64) == [[30, 10]]
+
+
+def test_cli_identifies_the_clip_cards(tmp_path):
+    rng = np.random.default_rng(3)
+    cards = [synthetic_card(rng, size=220) for _ in range(2)]
+    app = create_app(root_dir=str(tmp_path))
+    with app.app_context():
+        pictures = [io.BytesIO(cv2.imencode(".png", enrollment_picture(enrollment_frame(card)))[1].tobytes()) for card in cards]
+        users = UserDAO().create_many([
+            {"first_name": "Ada", "last_name": "Lovelace", "picture": pictures[0]},
+            {"first_name": "Alan", "last_name": "Turing", "picture": pictures[1]},
+        ])
+        user_ids = [u.id for u in users]
+
+    # 6 frames of the first card, 6 of the second one at another place
+    positions = [(100, 80), (300, 150)]
+    clip = str(tmp_path / "clip.avi")
+    writer = cv2.VideoWriter(clip, cv2.VideoWriter_fourcc(*"MJPG"), 10, (640, 480))
+    for card, (x, y) in zip(cards, positions):
+        framed = framed_card(card)
+        frame = np.full((480, 640, 3), 235, np.uint8)
+        frame[y:y + framed.shape[0], x:x + framed.shape[1]] = framed
+        for _ in range(6):
+            writer.write(frame)
+    writer.release()
+
+    output = str(tmp_path / "identifications.json")
+    main([clip, "--output", output, "--root-dir", str(tmp_path), "--step", "2", "--processes", "1"])
+    with open(output) as f:
+        entries = json.load(f)
+    assert [(e["frame"], e["user_id"]) for e in entries] == [(i, user_ids[i // 6]) for i in range(0, 12, 2)]
+    size = framed_card(cards[0]).shape[0]
+    for entry in entries:
+        x, y = positions[entry["frame"] // 6]
+        # The contour lies along the card border, in the video image coordinates
+        points = np.array(entry["contour"])
+        assert np.all(points >= [x - 3, y - 3]) and np.all(points <= [x + size + 3, y + size + 3])
+        assert np.all(points.max(axis=0) - points.min(axis=0) >= size * 0.8)